@@ -28,14 +28,34 @@ See the website at www.piborg.org/rockyborg for more details
 
 # Import the libraries we need
 import io
+import os
+import errno
+import math
+import select
 import fcntl
+import ctypes
+import struct
 import types
 import time
+import threading
+import collections
 from sys import version_info
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Shared state needs Python 3.8 or newer
+    shared_memory = None
 
 # Constant values
 I2C_SLAVE                   = 0x0703
+I2C_TIMEOUT                 = 0x0702  # Sets the kernel timeout for every transfer on the bus, in units of 10 ms
+I2C_RDWR                    = 0x0707
+I2C_RDWR_MAX_MSGS           = 42    # Most messages the kernel accepts in a single I2C_RDWR call
 I2C_MAX_LEN                 = 4
+I2C_BUS_CLOCK               = 100000  # Default I²C bus clock in Hz, the Raspberry Pi standard rate
+I2C_BITS_PER_BYTE           = 9     # Eight data bits plus the acknowledge bit
+I2C_BITS_OVERHEAD           = 2     # The start and stop conditions for each transaction
+BUS_USAGE_WINDOW            = 1.0   # Time in seconds over which bus utilisation is measured
 MOTOR_PWM_MAX               = 255
 DEFAULT_SERVO_PWM_MIN       = 1000  # Should be a 1 ms burst, typical servo minimum
 DEFAULT_SERVO_PWM_MAX       = 2000  # Should be a 2 ms burst, typical servo maximum
@@ -75,9 +95,328 @@ COMMAND_SET_I2C_ADD         = 0xAA  # Set a new I²C address
 COMMAND_VALUE_FWD           = 1     # I²C value representing forward
 COMMAND_VALUE_REV           = 2     # I²C value representing reverse
 
+GET_COMMANDS                = frozenset([COMMAND_GET_LED, COMMAND_GET_A, COMMAND_GET_B, COMMAND_GET_FAILSAFE,
+                                         COMMAND_GET_SERVO, COMMAND_GET_SERVO_MIN, COMMAND_GET_SERVO_MAX,
+                                         COMMAND_GET_SERVO_BOOT, COMMAND_GET_MOTORS_EN, COMMAND_GET_ID])
+CALIBRATION_COMMANDS        = frozenset([COMMAND_SET_SERVO_MIN, COMMAND_SET_SERVO_MAX, COMMAND_SET_SERVO_BOOT])
+
 COMMAND_VALUE_ON            = 1     # I²C value representing on
 COMMAND_VALUE_OFF           = 0     # I²C value representing off
 
+PRINT_DEBUG                 = 0     # Diagnostic detail, hidden by default
+PRINT_INFO                  = 1     # General status messages
+PRINT_WARNING               = 2     # Problems which have been worked around
+PRINT_ERROR                 = 3     # Commands which have failed
+PRINT_REPEAT_INTERVAL       = 1.0   # Minimum time in seconds between repeats of the same warning or error
+PRINT_HISTORY_LIMIT         = 100   # Number of different messages remembered before ones not seen recently are forgotten
+
+REALTIME_PRIORITY           = 50    # SCHED_FIFO priority used by EnableRealTime, 1 (lowest) to 99 (highest)
+MCL_CURRENT                 = 1     # mlockall flag, lock pages which are already mapped
+MCL_FUTURE                  = 2     # mlockall flag, lock pages which are mapped later
+
+SHARED_STATE_NAME           = 'RockyBorg'     # Default name of the shared memory block used by StartSharedState
+SHARED_STATE_MAGIC          = 0x52424F52      # Marks the start of a RockyBorg shared memory block
+SHARED_STATE_VERSION        = 2
+SHARED_STATE_HEADER         = '<IIQI'         # Magic, version, sequence (odd while being written), publisher process ID
+SHARED_STATE_PAYLOAD        = '<ddddd' + 'Qdbdddibb' + 'QQddd'  # Setpoints, telemetry, statistics
+SHARED_STATE_READ_RETRIES   = 1000            # Times a reader tries again while the block is being written
+
+TELEMETRY_FAST_INTERVAL     = 0.05  # Time in seconds between telemetry reads after a change or a command
+TELEMETRY_SLOW_INTERVAL     = 1.0   # Longest time in seconds between telemetry reads when nothing is changing
+TELEMETRY_START_TIMEOUT     = 2.0   # Time in seconds StartTelemetry waits for the first reading
+
+# LED patterns for SetLedPattern, each is a list of (state, seconds) steps which repeat, None holds the step forever
+LED_PATTERNS                = {
+        'off':          [(False, None)],
+        'solid':        [(True, None)],
+        'blink':        [(True, 0.5), (False, 0.5)],
+        'heartbeat':    [(True, 0.1), (False, 0.15), (True, 0.1), (False, 0.65)],
+}
+LED_ERROR_FLASH             = 0.2   # Time in seconds the LED is on and off for each flash of an error code
+LED_ERROR_PAUSE             = 1.5   # Time in seconds the LED is off between repeats of an error code
+
+# Immutable copy of the board state taken by the telemetry thread
+# sequence counts the sweeps, timestamp is when the sweep finished and changed is when a value last changed
+# Values which could not be read are None
+TelemetrySnapshot = collections.namedtuple('TelemetrySnapshot', [
+        'sequence', 'timestamp', 'changed',
+        'led', 'motor1', 'motor2', 'servoPosition', 'servoRaw', 'failsafe', 'motorsEnabled',
+        'servoMinimum', 'servoMaximum', 'servoStartup'])
+
+# Returned by GetTelemetry until the first sweep has finished, nothing has been read yet
+EMPTY_TELEMETRY = TelemetrySnapshot._make([0] + [None] * (len(TelemetrySnapshot._fields) - 1))
+
+
+# Raised when an I²C transfer does not finish before its timeout
+class BusTimeoutError(IOError):
+    pass
+
+
+def SetNonBlocking(i2cFile):
+    """
+SetNonBlocking(i2cFile)
+
+Switches an open file to non-blocking mode so transfers with a timeout can wait using poll instead
+    """
+    flags = fcntl.fcntl(i2cFile, fcntl.F_GETFL)
+    fcntl.fcntl(i2cFile, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def WaitForPoll(poller, deadline, action):
+    """
+WaitForPoll(poller, deadline, action)
+
+Waits for a poll object to be ready, raises BusTimeoutError if deadline (a time.time() value) passes first
+    """
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise BusTimeoutError('I²C %s timed out' % (action))
+    if not poller.poll(int(math.ceil(remaining * 1000))):
+        raise BusTimeoutError('I²C %s timed out' % (action))
+
+
+# Last values commanded for each output, None until first set, timestamp is when a value last changed
+Setpoints = collections.namedtuple('Setpoints', ['motor1', 'motor2', 'servoPosition', 'led', 'timestamp'])
+
+# Result of EnableRealTime, each setting is True if it was applied and messages explains any which were not
+RealTimeReport = collections.namedtuple('RealTimeReport', ['scheduler', 'affinity', 'memoryLocked', 'messages'])
+
+
+def EnableRealTime(priority = REALTIME_PRIORITY, cpus = None, lockMemory = True):
+    """
+report = EnableRealTime([priority], [cpus], [lockMemory])
+
+Gives the calling thread real-time scheduling so other busy threads and processes cannot delay it
+Call this from the thread which sends commands to the RockyBorg, e.g. the main control loop
+priority is the SCHED_FIFO priority, from 1 (lowest) to 99 (highest), default is 50
+cpus if supplied is a list of CPU numbers the thread is allowed to run on, e.g. [3]
+lockMemory if True locks the whole process into RAM with mlockall so it is never paged out
+
+Anything which cannot be set, usually due to missing permissions (run with sudo), is skipped
+Returns a RealTimeReport saying what was applied, with a message for anything which was not
+e.g.
+report = RockyBorg.EnableRealTime()
+for message in report.messages:
+    print(message)
+    """
+    messages = []
+    scheduler = False
+    affinity = False
+    memoryLocked = False
+
+    # Real-time priority, on Linux process ID 0 means the calling thread
+    if hasattr(os, 'sched_setscheduler'):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            scheduler = True
+        except OSError as e:
+            messages.append('Could not set SCHED_FIFO priority %d: %s' % (priority, e.strerror))
+    else:
+        messages.append('Real-time scheduling needs Python 3.3 or newer')
+
+    # CPU affinity
+    if cpus is not None:
+        if hasattr(os, 'sched_setaffinity'):
+            try:
+                os.sched_setaffinity(0, cpus)
+                affinity = True
+            except OSError as e:
+                messages.append('Could not set CPU affinity to %s: %s' % (cpus, e.strerror))
+        else:
+            messages.append('CPU affinity needs Python 3.3 or newer')
+
+    # Memory locking
+    if lockMemory:
+        try:
+            libc = ctypes.CDLL(None, use_errno = True)
+            if libc.mlockall(MCL_CURRENT | MCL_FUTURE) == 0:
+                memoryLocked = True
+            else:
+                messages.append('Could not lock memory: %s' % (os.strerror(ctypes.get_errno())))
+        except (OSError, AttributeError):
+            messages.append('Could not lock memory: mlockall is not available')
+
+    return RealTimeReport(scheduler, affinity, memoryLocked, messages)
+
+
+def DisableRealTime():
+    """
+DisableRealTime()
+
+Undoes EnableRealTime for the calling thread, normal scheduling on any CPU and unlocked memory
+    """
+    if hasattr(os, 'sched_setscheduler'):
+        try:
+            os.sched_setscheduler(0, os.SCHED_OTHER, os.sched_param(0))
+        except OSError:
+            pass
+    if hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, range(os.cpu_count() or 1))
+        except OSError:
+            pass
+    try:
+        ctypes.CDLL(None, use_errno = True).munlockall()
+    except (OSError, AttributeError):
+        pass
+
+
+# Structures used by the I2C_RDWR ioctl, these match struct i2c_msg and struct i2c_rdwr_ioctl_data in linux/i2c-dev.h
+class I2cMsg(ctypes.Structure):
+    _fields_ = [('addr', ctypes.c_uint16),
+                ('flags', ctypes.c_uint16),
+                ('len', ctypes.c_uint16),
+                ('buf', ctypes.POINTER(ctypes.c_char))]
+
+
+class I2cRdwrIoctlData(ctypes.Structure):
+    _fields_ = [('msgs', ctypes.POINTER(I2cMsg)),
+                ('nmsgs', ctypes.c_uint32)]
+
+
+# Class used to account for the traffic on an I²C bus
+class BusUsage:
+    """
+Accounts for the I²C traffic sent to every RockyBorg on one bus, use GetBusUsage to get the one for a bus
+
+busNumber               The I²C bus being tracked
+clock                   The I²C bus clock in Hz, used to estimate the time each transaction takes
+budget                  Fraction of the bus time low priority traffic (telemetry) may push usage up to, None for no limit
+window                  Time in seconds over which the utilisation is measured
+
+Commands are never throttled, only low priority traffic checks OverBudget before using the bus
+    """
+
+    def __init__(self, busNumber, clock = I2C_BUS_CLOCK):
+        self.busNumber = busNumber
+        self.clock = clock
+        self.budget = None
+        self.window = BUS_USAGE_WINDOW
+        self.lock = threading.Lock()
+        self.recent = collections.deque()
+        self.recentTime = 0.0
+        self.totals = {}
+        self.fallbacks = {}
+
+    def Record(self, address, command, byteCount):
+        """
+busTime = Record(address, command, byteCount)
+
+Records a single transaction of byteCount bytes (not including the address) for a command
+Returns the estimated bus time in seconds
+        """
+        bits = I2C_BITS_OVERHEAD + (I2C_BITS_PER_BYTE * (byteCount + 1))
+        busTime = float(bits) / self.clock
+        now = time.time()
+        with self.lock:
+            total = self.totals.get((address, command))
+            if total is None:
+                total = [0, 0, 0.0]
+                self.totals[(address, command)] = total
+            total[0] += 1
+            total[1] += byteCount
+            total[2] += busTime
+            self.recent.append((now, busTime))
+            self.recentTime += busTime
+            self.Prune(now)
+        return busTime
+
+    def RecordFallback(self, address, messageCount):
+        """
+RecordFallback(address, messageCount)
+
+Records a batch of messageCount writes which failed as one I2C_RDWR transfer and was sent again one write at a time
+        """
+        with self.lock:
+            total = self.fallbacks.setdefault(address, [0, 0])
+            total[0] += 1
+            total[1] += messageCount
+
+    def Fallbacks(self, address = None):
+        """
+batches, messages = Fallbacks([address])
+
+Returns how many batches were resent one write at a time and how many writes they held since the start
+If address is given only batches for the board at that address are included
+        """
+        batches = 0
+        messages = 0
+        with self.lock:
+            for totalAddress, total in self.fallbacks.items():
+                if (address is None) or (address == totalAddress):
+                    batches += total[0]
+                    messages += total[1]
+        return batches, messages
+
+    def Prune(self, now):
+        """
+Prune(now)
+
+Drops transactions older than window from the utilisation figure, called with lock held
+        """
+        oldest = now - self.window
+        while self.recent and (self.recent[0][0] < oldest):
+            self.recentTime -= self.recent.popleft()[1]
+
+    def Utilisation(self):
+        """
+fraction = Utilisation()
+
+Returns the estimated fraction of the bus time used over the last window seconds, 0.0 to 1.0
+        """
+        with self.lock:
+            self.Prune(time.time())
+            return max(0.0, self.recentTime) / self.window
+
+    def OverBudget(self):
+        """
+over = OverBudget()
+
+Returns True if budget is set and the current utilisation is above it
+        """
+        if self.budget is None:
+            return False
+        return self.Utilisation() > self.budget
+
+    def Statistics(self, address = None):
+        """
+statistics = Statistics([address])
+
+Returns a dictionary of {command: (transactions, bytes, busTime)} totals since the start
+If address is given only traffic for the board at that address is included
+        """
+        statistics = {}
+        with self.lock:
+            for (totalAddress, command), total in self.totals.items():
+                if (address is None) or (address == totalAddress):
+                    old = statistics.get(command, (0, 0, 0.0))
+                    statistics[command] = (old[0] + total[0], old[1] + total[1], old[2] + total[2])
+        return statistics
+
+
+busUsages = {}
+busUsagesLock = threading.Lock()
+
+
+def GetBusUsage(busNumber = 1):
+    """
+usage = GetBusUsage([busNumber])
+
+Returns the BusUsage object which accounts for traffic on an I²C bus, shared by all RockyBorg instances on that bus
+The busNumber if supplied is which I²C bus, if not supplied the default is 1
+e.g.
+usage = RockyBorg.GetBusUsage(1)
+usage.clock = 400000        # Bus has been set to 400 kHz
+usage.budget = 0.5          # Throttle telemetry if the bus is more than 50% busy
+print(usage.Utilisation())
+    """
+    with busUsagesLock:
+        usage = busUsages.get(busNumber)
+        if usage is None:
+            usage = BusUsage(busNumber)
+            busUsages[busNumber] = usage
+        return usage
+
 
 def ScanForRockyBorg(busNumber = 1):
     """
@@ -184,6 +523,451 @@ Warning, this new I²C address will still be used after resetting the power on t
         print('Failed to set new I²C address...')
 
 
+# Thread used to read the RockyBorg state in the background
+class Telemetry(threading.Thread):
+    """
+Reads the state of a RockyBorg in the background, use RockyBorg.StartTelemetry to create one
+
+snapshot                The latest TelemetrySnapshot, replaced after each sweep but never modified
+fastInterval            Time in seconds between sweeps after a change or a command
+slowInterval            Longest time in seconds between sweeps when nothing is changing
+
+The time between sweeps doubles each time nothing has changed, up to slowInterval
+Any command sent to the board or any change seen drops it back to fastInterval
+Sweeps are skipped while the bus is over the budget set in its BusUsage
+    """
+
+    def __init__(self, board, fastInterval = TELEMETRY_FAST_INTERVAL, slowInterval = TELEMETRY_SLOW_INTERVAL):
+        super(Telemetry, self).__init__()
+        self.daemon = True
+        self.board = board
+        self.fastInterval = fastInterval
+        self.slowInterval = slowInterval
+        self.interval = fastInterval
+        self.snapshot = None
+        self.subscribers = []
+        self.subscriberLock = threading.Lock()
+        self.event = threading.Event()
+        self.firstSweep = threading.Event()
+        self.readCalibration = True
+        self.terminated = False
+        self.start()
+
+    def run(self):
+        # This method runs in a separate thread, a failed sweep is reported and the next one tried as normal
+        while not self.terminated:
+            try:
+                self.Sweep()
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                self.board.PrintLevel(PRINT_ERROR, 'Telemetry sweep failed: %s', e)
+            lastSweep = time.time()
+            while not self.terminated:
+                # Wait for the next sweep, a command may shorten the interval while we wait
+                remaining = (lastSweep + self.interval) - time.time()
+                if remaining <= 0:
+                    break
+                if self.event.wait(remaining):
+                    self.event.clear()
+
+    def Nudge(self, command):
+        """
+Nudge(command)
+
+Called by the board when a command is sent, makes the next sweep happen sooner
+LED commands do not, so a pattern blinking the LED does not keep telemetry polling quickly
+        """
+        if command in CALIBRATION_COMMANDS:
+            self.readCalibration = True
+        if command == COMMAND_SET_LED:
+            return
+        if self.interval > self.fastInterval:
+            self.interval = self.fastInterval
+            self.event.set()
+
+    def Sweep(self):
+        """
+Sweep()
+
+Reads all of the board values once and publishes a new snapshot
+        """
+        board = self.board
+        previous = self.snapshot
+        if (previous is not None) and (board.busUsage is not None) and board.busUsage.OverBudget():
+            # The bus is too busy, skip this sweep and back off
+            self.interval = min(self.interval * 2, self.slowInterval)
+            return
+        if self.readCalibration or (previous is None):
+            self.readCalibration = False
+            servoMinimum = board.GetServoMinimum()
+            servoMaximum = board.GetServoMaximum()
+            servoStartup = board.GetServoStartup()
+        else:
+            servoMinimum = previous.servoMinimum
+            servoMaximum = previous.servoMaximum
+            servoStartup = previous.servoStartup
+        led = board.GetLed()
+        motor1 = board.GetMotor1()
+        motor2 = board.GetMotor2()
+        servoRaw = board.GetRawServoPosition()
+        failsafe = board.GetCommsFailsafe()
+        motorsEnabled = board.GetMotorsEnabled()
+        # The limits may be unknown after a failed read, or equal while the servo is being calibrated
+        pwmMinimum = board.SERVO_PWM_MIN
+        pwmMaximum = board.SERVO_PWM_MAX
+        if (servoRaw is None) or (pwmMinimum is None) or (pwmMaximum is None) or (pwmMinimum == pwmMaximum):
+            servoPosition = None
+        else:
+            powerOut = (float(servoRaw) - pwmMinimum) / (pwmMaximum - pwmMinimum)
+            servoPosition = (2.0 * powerOut) - 1.0
+        values = (led, motor1, motor2, servoPosition, servoRaw, failsafe, motorsEnabled,
+                  servoMinimum, servoMaximum, servoStartup)
+
+        # Publish the new snapshot and adjust the polling rate
+        now = time.time()
+        if previous is None:
+            snapshot = TelemetrySnapshot(1, now, now, *values)
+            changed = True
+        else:
+            changed = (values != previous[3:])
+            if changed:
+                snapshot = TelemetrySnapshot(previous.sequence + 1, now, now, *values)
+            else:
+                snapshot = TelemetrySnapshot(previous.sequence + 1, now, previous.changed, *values)
+        self.snapshot = snapshot
+        self.firstSweep.set()
+        sharedState = board.sharedState
+        if sharedState is not None:
+            sharedState.Publish(snapshot)
+        # Only a change to something other than the LED keeps the fast polling rate, see Nudge
+        if (previous is None) or (values[1:] != previous[4:]):
+            self.interval = self.fastInterval
+        else:
+            self.interval = min(self.interval * 2, self.slowInterval)
+        if changed:
+            with self.subscriberLock:
+                subscribers = list(self.subscribers)
+            for callback in subscribers:
+                try:
+                    callback(snapshot, previous)
+                except KeyboardInterrupt:
+                    raise
+                except Exception as e:
+                    board.PrintLevel(PRINT_ERROR, 'Telemetry subscriber failed: %s', e)
+
+    def Subscribe(self, callback):
+        """
+Subscribe(callback)
+
+Calls callback(snapshot, previous) from the telemetry thread whenever a value changes
+previous is None for the very first snapshot
+        """
+        with self.subscriberLock:
+            self.subscribers.append(callback)
+
+    def Unsubscribe(self, callback):
+        """
+Unsubscribe(callback)
+
+Stops calling a callback previously passed to Subscribe
+        """
+        with self.subscriberLock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+
+def ErrorCodePattern(code):
+    """
+steps = ErrorCodePattern(code)
+
+Returns the LED steps which flash code times, then pause, used by SetLedPattern('error', code)
+    """
+    if code < 1:
+        raise ValueError('Error code %d must be 1 or more' % (code))
+    steps = []
+    for i in range(code):
+        steps.append((True, LED_ERROR_FLASH))
+        steps.append((False, LED_ERROR_FLASH))
+    steps[-1] = (False, LED_ERROR_PAUSE)
+    return steps
+
+
+# Thread which plays LED patterns, use RockyBorg.SetLedPattern to create one
+class LedPattern(threading.Thread):
+    """
+Plays a repeating LED pattern for a RockyBorg, use RockyBorg.SetLedPattern
+
+steps                   The pattern being played as a list of (state, seconds) steps, None when stopped
+
+The LED state is taken from the board setpoints rather than read back, so the LED is only written when it changes
+    """
+
+    def __init__(self, board):
+        super(LedPattern, self).__init__()
+        self.daemon = True
+        self.board = board
+        self.steps = None
+        self.event = threading.Event()
+        self.terminated = False
+        self.start()
+
+    def run(self):
+        # This method runs in a separate thread
+        while not self.terminated:
+            self.event.clear()
+            steps = self.steps
+            if not steps:
+                self.event.wait()
+                continue
+            # Play the steps in order until the pattern is changed
+            changed = False
+            while not (changed or self.terminated):
+                for state, duration in steps:
+                    if self.board.setpoints.led != state:
+                        self.board.SetLed(state)
+                    if self.event.wait(duration):
+                        changed = True
+                        break
+
+    def SetSteps(self, steps):
+        """
+SetSteps(steps)
+
+Starts playing a new list of (state, seconds) steps from the beginning, None stops and leaves the LED as it is
+        """
+        self.steps = steps
+        self.event.set()
+
+
+# Copy of the shared memory block read by SharedStateReader, values which are not known are None
+SharedStateSample = collections.namedtuple('SharedStateSample', [
+        'sequence', 'publishTime',
+        'setMotor1', 'setMotor2', 'setServoPosition', 'setLed', 'setpointTime',
+        'telemetrySequence', 'telemetryTime', 'led', 'motor1', 'motor2', 'servoPosition', 'servoRaw', 'failsafe', 'motorsEnabled',
+        'transactions', 'bytes', 'busTime', 'busUtilisation'])
+
+
+# Helpers to store None in the fixed size shared memory fields
+def SharedFloat(value):
+    if value is None:
+        return float('nan')
+    return float(value)
+
+
+def SharedInt(value):
+    if value is None:
+        return -1
+    return int(value)
+
+
+def FromSharedFloat(value):
+    if value != value:
+        # NaN
+        return None
+    return value
+
+
+def FromSharedInt(value):
+    if value < 0:
+        return None
+    return value
+
+
+# Names of the shared state blocks created by this process
+sharedStateNames = set()
+
+
+def AttachSharedMemory(name):
+    """
+memory = AttachSharedMemory(name)
+
+Attaches to an existing shared memory block without this process removing it when it ends
+    """
+    try:
+        return shared_memory.SharedMemory(name = name, track = False)
+    except TypeError:
+        # Before Python 3.13 every attached block is tracked, stop it being removed when this process ends
+        memory = shared_memory.SharedMemory(name = name)
+        if name not in sharedStateNames:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(memory._name, 'shared_memory')
+        return memory
+
+
+def SharedStateOwner(name):
+    """
+pid = SharedStateOwner(name)
+
+Returns the ID of the running process publishing an existing shared state block, None if that process has gone
+Blocks from another version of this library do not say who published them and are treated as left over
+    """
+    memory = AttachSharedMemory(name)
+    try:
+        if len(memory.buf) < struct.calcsize(SHARED_STATE_HEADER):
+            return None
+        magic, version, sequence, pid = struct.unpack_from(SHARED_STATE_HEADER, memory.buf, 0)
+    finally:
+        memory.close()
+    if (magic != SHARED_STATE_MAGIC) or (version != SHARED_STATE_VERSION) or (pid == 0):
+        return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        # Running as another user
+        pass
+    return pid
+
+
+# Class used to publish the state of a RockyBorg to other processes
+class SharedState:
+    """
+Publishes the setpoints, telemetry and bus statistics of a RockyBorg into shared memory, use RockyBorg.StartSharedState
+
+The block is a header followed by a fixed layout payload, see SHARED_STATE_HEADER and SHARED_STATE_PAYLOAD
+The header sequence is odd while the payload is being written, readers retry until it is even and unchanged
+Use SharedStateReader in other processes to read it without any system calls or I²C traffic
+    """
+
+    def __init__(self, board, name = SHARED_STATE_NAME):
+        if shared_memory is None:
+            raise RuntimeError('Shared state needs Python 3.8 or newer')
+        self.board = board
+        self.name = name
+        self.lock = threading.Lock()
+        self.sequence = 0
+        size = struct.calcsize(SHARED_STATE_HEADER) + struct.calcsize(SHARED_STATE_PAYLOAD)
+        try:
+            self.memory = shared_memory.SharedMemory(name = name, create = True, size = size)
+        except FileExistsError:
+            # Only replace a block left over from a program which did not close properly, never a live one
+            owner = SharedStateOwner(name)
+            if owner is not None:
+                raise RuntimeError('Shared state %s is already being published by process %d, '
+                                   'stop that program or use a different name' % (name, owner))
+            old = shared_memory.SharedMemory(name = name)
+            old.close()
+            old.unlink()
+            self.memory = shared_memory.SharedMemory(name = name, create = True, size = size)
+        sharedStateNames.add(name)
+        struct.pack_into(SHARED_STATE_HEADER, self.memory.buf, 0, SHARED_STATE_MAGIC, SHARED_STATE_VERSION, 0, os.getpid())
+        self.Publish()
+
+    def Publish(self, snapshot = None):
+        """
+Publish([snapshot])
+
+Writes the current state into the shared memory block
+Called by the board when a setpoint changes and by the telemetry thread after each sweep
+The values are read while holding the write lock, so the last call to publish always writes the newest state
+        """
+        with self.lock:
+            self.WriteValues(snapshot)
+
+    def WriteValues(self, snapshot):
+        # Called with lock held
+        board = self.board
+        setpoints = board.setpoints
+        if snapshot is None:
+            snapshot = board.GetTelemetry()
+        if snapshot is None:
+            telemetry = (0, float('nan'), -1, float('nan'), float('nan'), float('nan'), -1, -1, -1)
+        else:
+            telemetry = (snapshot.sequence, SharedFloat(snapshot.timestamp), SharedInt(snapshot.led),
+                         SharedFloat(snapshot.motor1), SharedFloat(snapshot.motor2), SharedFloat(snapshot.servoPosition),
+                         SharedInt(snapshot.servoRaw), SharedInt(snapshot.failsafe), SharedInt(snapshot.motorsEnabled))
+        transactions = 0
+        byteCount = 0
+        busTime = 0.0
+        for total in board.GetBusStatistics().values():
+            transactions += total[0]
+            byteCount += total[1]
+            busTime += total[2]
+        values = ((SharedFloat(setpoints.motor1), SharedFloat(setpoints.motor2), SharedFloat(setpoints.servoPosition),
+                   SharedFloat(setpoints.led), SharedFloat(setpoints.timestamp)) + telemetry +
+                  (transactions, byteCount, busTime, board.GetBusUtilisation(), time.time()))
+        headerSize = struct.calcsize(SHARED_STATE_HEADER)
+        buf = self.memory.buf
+        if buf is None:
+            return
+        self.sequence += 1
+        struct.pack_into('<Q', buf, 8, self.sequence)
+        struct.pack_into(SHARED_STATE_PAYLOAD, buf, headerSize, *values)
+        self.sequence += 1
+        struct.pack_into('<Q', buf, 8, self.sequence)
+
+    def Close(self):
+        """
+Close()
+
+Removes the shared memory block, readers which are already attached keep their copy until they close
+        """
+        with self.lock:
+            self.memory.close()
+            self.memory.unlink()
+        sharedStateNames.discard(self.name)
+
+
+# Class used to read the state published by another process
+class SharedStateReader:
+    """
+Reads the state of a RockyBorg published by another process with RockyBorg.StartSharedState
+e.g.
+import RockyBorg
+reader = RockyBorg.SharedStateReader()
+sample = reader.Read()
+print(sample.setMotor1, sample.motor1, sample.busUtilisation)
+    """
+
+    def __init__(self, name = SHARED_STATE_NAME):
+        if shared_memory is None:
+            raise RuntimeError('Shared state needs Python 3.8 or newer')
+        self.memory = AttachSharedMemory(name)
+        magic, version, sequence, pid = struct.unpack_from(SHARED_STATE_HEADER, self.memory.buf, 0)
+        if (magic != SHARED_STATE_MAGIC) or (version != SHARED_STATE_VERSION):
+            self.memory.close()
+            raise ValueError('%s is not a version %d RockyBorg shared state block' % (name, SHARED_STATE_VERSION))
+        self.headerSize = struct.calcsize(SHARED_STATE_HEADER)
+
+    def Read(self):
+        """
+sample = Read()
+
+Returns a SharedStateSample with the latest published state, or None if it was changing too quickly to read
+        """
+        buf = self.memory.buf
+        for i in range(SHARED_STATE_READ_RETRIES):
+            before = struct.unpack_from('<Q', buf, 8)[0]
+            if before & 1:
+                continue
+            values = struct.unpack_from(SHARED_STATE_PAYLOAD, buf, self.headerSize)
+            after = struct.unpack_from('<Q', buf, 8)[0]
+            if before == after:
+                break
+        else:
+            return None
+        (setMotor1, setMotor2, setServoPosition, setLed, setpointTime,
+         telemetrySequence, telemetryTime, led, motor1, motor2, servoPosition, servoRaw, failsafe, motorsEnabled,
+         transactions, byteCount, busTime, busUtilisation, publishTime) = values
+        return SharedStateSample(before // 2, publishTime,
+                FromSharedFloat(setMotor1), FromSharedFloat(setMotor2), FromSharedFloat(setServoPosition),
+                None if setLed != setLed else bool(setLed), FromSharedFloat(setpointTime),
+                telemetrySequence, FromSharedFloat(telemetryTime), None if led < 0 else bool(led),
+                FromSharedFloat(motor1), FromSharedFloat(motor2), FromSharedFloat(servoPosition), FromSharedInt(servoRaw),
+                None if failsafe < 0 else bool(failsafe), None if motorsEnabled < 0 else bool(motorsEnabled),
+                transactions, byteCount, busTime, busUtilisation)
+
+    def Close(self):
+        """
+Close()
+
+Detaches from the shared memory block
+        """
+        self.memory.close()
+
+
 # Class used to control RockyBorg
 class RockyBorg:
     """
@@ -193,14 +977,34 @@ busNumber               I²C bus on which the RockyBorg is attached (Rev 1 is bu
 bus                     the smbus object used to talk to the I²C bus
 i2cAddress              The I²C address of the RockyBorg chip to control
 foundChip               True if the RockyBorg chip can be seen, False otherwise
+setpoints               The last values sent by the Set functions as a Setpoints tuple, kept without using the I²C bus
+telemetry               The Telemetry thread reading the board in the background, None until StartTelemetry is called
+sharedState             The SharedState publishing to other processes, None until StartSharedState is called
+ledPattern              The LedPattern thread playing LED patterns, None until SetLedPattern is called
+busUsage                The BusUsage object accounting for traffic on busNumber, set when the bus is opened
+timeout                 Default time in seconds each call may wait for the I²C bus, None to wait forever
+                        Set it before Init, the I²C files are only switched to non-blocking mode when it is not None
+                        Calls which time out raise BusTimeoutError, or print an error for the Get and Set functions
+                        i2c-dev cannot be polled, so a transfer which has started is only ended by the kernel timeout
+                        Init sets that for the whole bus to this value rounded up to 10 ms, see SetupTimeout
+                        A call may therefore take up to timeout plus that kernel timeout when the bus stalls
 printFunction           Function reference to call when printing text, if None "print" is used
+printLevel              Lowest level of message which is printed, PRINT_DEBUG, PRINT_INFO, PRINT_WARNING or PRINT_ERROR
+printRepeatInterval     Time in seconds before a repeated warning or error is printed again
     """
 
     # Shared values used by this class
     busNumber               = 1                     # Check here for Rev 1 vs Rev 2 and select the correct bus
     i2cAddress              = I2C_ID_ROCKYBORG      # I²C address, override for a different address
     foundChip               = False
+    telemetry               = None
+    sharedState             = None
+    ledPattern              = None
+    busUsage                = None
+    timeout                 = None
     printFunction           = None
+    printLevel              = PRINT_INFO
+    printRepeatInterval     = PRINT_REPEAT_INTERVAL
     i2cWrite                = None
     i2cRead                 = None
 
@@ -209,15 +1013,38 @@ printFunction           Function reference to call when printing text, if None "
     SERVO_PWM_MAX           = DEFAULT_SERVO_PWM_MAX
 
 
-    def RawWrite(self, command, data):
+    def __init__(self):
         """
-RawWrite(command, data)
+RockyBorg()
+
+Creates a new RockyBorg object, call Init before using the board
+        """
+        # Per board message history used to rate limit repeated warnings and errors
+        self.printLock = threading.Lock()
+        self.printHistory = {}
+        self.printTimer = None
+        # Held for each complete I²C exchange so threads sharing the board cannot interleave a command and its reply
+        self.busLock = threading.RLock()
+        # Writes queued by StartBatch, kept separately for each thread
+        self.batchLocal = threading.local()
+        # Last commanded values, replaced as a whole so readers never see a partial update
+        self.setpointLock = threading.Lock()
+        self.setpoints = Setpoints(None, None, None, None, None)
+
+
+    def RawWrite(self, command, data, timeout = None):
+        """
+RawWrite(command, data, [timeout])
 
 Sends a raw command on the I²C bus to the RockyBorg
 Command codes can be found at the top of RockyBorg.py, data is a list of 0 or more byte values
+If timeout is given (in seconds) it is used instead of the timeout setting, BusTimeoutError is raised if it runs out
 
 Under most circumstances you should use the appropriate function instead of RawWrite
+If StartBatch has been called by this thread the write is queued until FlushBatch is called
         """
+        if timeout is None:
+            timeout = self.timeout
         if version_info[0] < 3:
             # Python 2 uses the character string type for I²C data
             rawOutput = chr(command)
@@ -228,24 +1055,62 @@ Under most circumstances you should use the appropriate function instead of RawW
             rawOutput = [command]
             rawOutput.extend(data)
             rawOutput = bytes(rawOutput)
-        self.i2cWrite.write(rawOutput)
+        batch = getattr(self.batchLocal, 'messages', None)
+        if (batch is not None) and (command not in GET_COMMANDS):
+            # Batching, send later with FlushBatch
+            batch.append((command, rawOutput, {}))
+        else:
+            if timeout is None:
+                deadline = None
+            else:
+                deadline = time.time() + timeout
+            self.AcquireBus(deadline)
+            try:
+                self.WriteBytes(rawOutput, deadline)
+            finally:
+                self.busLock.release()
+            if self.busUsage is not None:
+                self.busUsage.Record(self.i2cAddress, command, len(rawOutput))
+        telemetry = self.telemetry
+        if (telemetry is not None) and (command not in GET_COMMANDS):
+            telemetry.Nudge(command)
 
 
-    def RawRead(self, command, length, retryCount = 3):
+    def RawRead(self, command, length, retryCount = 3, timeout = None):
         """
-RawRead(command, length, [retryCount])
+RawRead(command, length, [retryCount], [timeout])
 
 Reads data back from the RockyBorg after sending a GET command
 Command codes can be found at the top of RockyBorg.py, length is the number of bytes to read back
 
 The function checks that the first byte read back matches the requested command
 If it does not it will retry the request until retryCount is exhausted (default is 3 times)
+If timeout is given (in seconds) it is used instead of the timeout setting, it covers all of the retries
+BusTimeoutError is raised if the timeout runs out
 
 Under most circumstances you should use the appropriate function instead of RawRead
+If StartBatch has been called by this thread any queued writes are sent first
         """
+        if timeout is None:
+            timeout = self.timeout
+        if timeout is None:
+            deadline = None
+        else:
+            deadline = time.time() + timeout
+        if getattr(self.batchLocal, 'messages', None):
+            self.SendBatch()
         while retryCount > 0:
-            self.RawWrite(command, [])
-            rawReply = self.i2cRead.read(length)
+            self.AcquireBus(deadline)
+            try:
+                if deadline is None:
+                    self.RawWrite(command, [])
+                else:
+                    self.RawWrite(command, [], max(0.0, deadline - time.time()))
+                rawReply = self.ReadBytes(length, deadline)
+            finally:
+                self.busLock.release()
+            if self.busUsage is not None:
+                self.busUsage.Record(self.i2cAddress, command, length)
             reply = []
             for singleByte in rawReply:
                 if version_info[0] < 3:
@@ -262,6 +1127,181 @@ Under most circumstances you should use the appropriate function instead of RawR
             raise IOError('I²C read for command %d failed' % (command))
 
 
+    def AcquireBus(self, deadline):
+        """
+AcquireBus(deadline)
+
+Waits until no other thread is using the I²C bus for this board, call busLock.release() when finished
+deadline is a time.time() value, None waits forever, BusTimeoutError is raised if it passes first
+        """
+        if (deadline is None) or (version_info[0] < 3):
+            # Python 2 locks cannot time out
+            self.busLock.acquire()
+        elif not self.busLock.acquire(True, max(0.0, deadline - time.time())):
+            raise BusTimeoutError('Timed out waiting for the I²C bus')
+
+
+    def WriteBytes(self, rawOutput, deadline):
+        """
+WriteBytes(rawOutput, deadline)
+
+Writes raw bytes to the I²C device, used by RawWrite
+deadline is a time.time() value, None blocks until the write is done, BusTimeoutError is raised if it passes first
+        """
+        if deadline is None:
+            written = self.i2cWrite.write(rawOutput)
+            if (written is None) or (written < len(rawOutput)):
+                raise IOError('I²C write was not completed')
+            return
+        fd = self.i2cWrite.fileno()
+        poller = select.poll()
+        poller.register(fd, select.POLLOUT)
+        while len(rawOutput) > 0:
+            WaitForPoll(poller, deadline, 'write')
+            try:
+                written = os.write(fd, rawOutput)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    continue
+                raise
+            rawOutput = rawOutput[written:]
+
+
+    def ReadBytes(self, length, deadline):
+        """
+rawReply = ReadBytes(length, deadline)
+
+Reads raw bytes from the I²C device, used by RawRead
+deadline is a time.time() value, None blocks until the read is done, BusTimeoutError is raised if it passes first
+        """
+        if deadline is None:
+            rawReply = self.i2cRead.read(length)
+            if (rawReply is None) or (len(rawReply) < length):
+                raise IOError('I²C read was not completed')
+            return rawReply
+        fd = self.i2cRead.fileno()
+        poller = select.poll()
+        poller.register(fd, select.POLLIN)
+        rawReply = self.i2cRead.read(0)
+        while len(rawReply) < length:
+            WaitForPoll(poller, deadline, 'read')
+            try:
+                chunk = os.read(fd, length - len(rawReply))
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    continue
+                raise
+            if len(chunk) == 0:
+                raise IOError('I²C device closed')
+            rawReply += chunk
+        return rawReply
+
+
+    def StartBatch(self):
+        """
+StartBatch()
+
+Starts queuing the writes made by this thread instead of sending them straight away
+Call FlushBatch to send all of the queued writes together in a single I²C transfer
+e.g.
+RB.StartBatch()
+RB.SetMotor1(0.5)
+RB.SetMotor2(-0.5)
+RB.SetServoPosition(0.25)
+RB.FlushBatch()
+Will send the three commands using one system call instead of three
+Reads made while batching send the queued writes first so the commands stay in order
+        """
+        if getattr(self.batchLocal, 'messages', None) is None:
+            self.batchLocal.messages = []
+
+
+    def FlushBatch(self):
+        """
+errors = FlushBatch()
+
+Sends the writes queued since StartBatch and stops batching for this thread
+Returns a list with an entry for each queued write, None if it was sent or the exception if it failed
+        """
+        errors = self.SendBatch()
+        self.batchLocal.messages = None
+        return errors
+
+
+    def SendBatch(self):
+        """
+errors = SendBatch()
+
+Sends the writes queued since StartBatch without stopping batching, see FlushBatch
+The writes are sent as a single I2C_RDWR transfer, if that fails each write is retried on its own to find which failed
+The kernel does not say how much of a failed transfer reached the board, so every write in it is sent again
+Some writes may therefore reach the board twice, this is safe for the RockyBorg commands as each sets an absolute value
+The number of times this happens is counted, see GetBatchFallbacks
+The timeout setting limits the wait for other threads and the one write at a time fallback,
+the I2C_RDWR transfer itself is only limited by the kernel I²C timeout, see SetupTimeout
+        """
+        batch = getattr(self.batchLocal, 'messages', None)
+        if not batch:
+            return []
+        self.batchLocal.messages = []
+        errors = []
+        sent = {}
+        for start in range(0, len(batch), I2C_RDWR_MAX_MSGS):
+            chunk = batch[start : start + I2C_RDWR_MAX_MSGS]
+            buffers = [ctypes.create_string_buffer(rawOutput, len(rawOutput)) for command, rawOutput, values in chunk]
+            messages = (I2cMsg * len(chunk))()
+            for i in range(len(chunk)):
+                messages[i].addr = self.i2cAddress
+                messages[i].flags = 0
+                messages[i].len = len(buffers[i])
+                messages[i].buf = ctypes.cast(buffers[i], ctypes.POINTER(ctypes.c_char))
+            transfer = I2cRdwrIoctlData(messages, len(chunk))
+            if self.timeout is None:
+                deadline = None
+            else:
+                deadline = time.time() + self.timeout
+            try:
+                self.AcquireBus(deadline)
+                try:
+                    fcntl.ioctl(self.i2cWrite, I2C_RDWR, transfer)
+                finally:
+                    self.busLock.release()
+                errors.extend([None] * len(chunk))
+                for command, rawOutput, values in chunk:
+                    sent.update(values)
+                    if self.busUsage is not None:
+                        self.busUsage.Record(self.i2cAddress, command, len(rawOutput))
+            except BusTimeoutError as e:
+                self.PrintLevel(PRINT_ERROR, 'Timed out sending a batch of %d commands!', len(chunk))
+                errors.extend([e] * len(chunk))
+            except KeyboardInterrupt:
+                raise
+            except:
+                # The kernel does not say which message failed, resend them all one at a time
+                if self.busUsage is not None:
+                    self.busUsage.RecordFallback(self.i2cAddress, len(chunk))
+                for command, rawOutput, values in chunk:
+                    try:
+                        self.AcquireBus(deadline)
+                        try:
+                            self.WriteBytes(rawOutput, deadline)
+                        finally:
+                            self.busLock.release()
+                        errors.append(None)
+                        sent.update(values)
+                        if self.busUsage is not None:
+                            self.busUsage.Record(self.i2cAddress, command, len(rawOutput))
+                    except KeyboardInterrupt:
+                        raise
+                    except Exception as e:
+                        self.PrintLevel(PRINT_ERROR, 'Failed sending command %d in a batch!', command)
+                        errors.append(e)
+        # Only the writes which reached the board change the setpoints
+        if sent:
+            self.RecordSetpoints(**sent)
+        return errors
+
+
     def InitBusOnly(self, busNumber, address):
         """
 InitBusOnly(busNumber, address)
@@ -275,20 +1315,146 @@ This call does not check the board is present or working, under most circumstanc
         fcntl.ioctl(self.i2cRead, I2C_SLAVE, self.i2cAddress)
         self.i2cWrite = io.open("/dev/i2c-" + str(self.busNumber), "wb", buffering = 0)
         fcntl.ioctl(self.i2cWrite, I2C_SLAVE, self.i2cAddress)
+        self.busUsage = GetBusUsage(self.busNumber)
+        self.SetupTimeout()
+
+
+    def SetupTimeout(self):
+        """
+SetupTimeout()
+
+Prepares the open I²C files for the timeout setting, called by Init and InitBusOnly
+Waits for the bus, retries and the one write at a time batch fallback are ended by the timeout using poll
+i2c-dev cannot be polled though, so a transfer already in the kernel is only ended by the kernel I²C timeout
+This sets that kernel timeout to the timeout setting, rounded up to 10 ms, it applies to every user of the bus
+        """
+        if self.timeout is None:
+            return
+        SetNonBlocking(self.i2cRead)
+        SetNonBlocking(self.i2cWrite)
+        try:
+            fcntl.ioctl(self.i2cWrite, I2C_TIMEOUT, max(1, int(math.ceil(self.timeout * 100))))
+        except IOError as e:
+            self.PrintLevel(PRINT_WARNING, 'Could not set the I²C kernel timeout, stalled transfers may take longer: %s', e)
+
+
+    def Print(self, message, *args):
+        """
+Print(message, [args])
+
+Wrapper used by the RockyBorg instance to print messages, will call printFunction if set, print otherwise
+Any args are formatted into message using %, this is only done if the message is actually printed
+        """
+        self.PrintLevel(PRINT_INFO, message, *args)
+
+
+    def RecordSetpoints(self, **values):
+        """
+RecordSetpoints(name = value, ...)
+
+Called by the Set functions after sending a value, updates setpoints
+While batching the values are kept with the queued write and only recorded once SendBatch has sent it
+        """
+        batch = getattr(self.batchLocal, 'messages', None)
+        if batch:
+            batch[-1][2].update(values)
+            return
+        with self.setpointLock:
+            self.setpoints = self.setpoints._replace(timestamp = time.time(), **values)
+        sharedState = self.sharedState
+        if sharedState is not None:
+            sharedState.Publish()
 
 
-    def Print(self, message):
+    def PrintLevel(self, level, message, *args):
         """
-Print(message)
+PrintLevel(level, message, [args])
 
-Wrapper used by the RockyBorg instance to print(messages, will call printFunction if set, print otherwise)
+Prints a message at the given level, PRINT_DEBUG, PRINT_INFO, PRINT_WARNING or PRINT_ERROR
+Messages below printLevel are dropped without being formatted
+Warnings and errors are rate limited for each message, repeats within printRepeatInterval seconds are not printed
+Instead they are counted and the count is added to the next copy of that message which is printed
+If the repeats stop, the count is printed by FlushPrints once printRepeatInterval has passed
         """
+        if level < self.printLevel:
+            return
+        elif self.printFunction == self.NoPrint:
+            return
+        suppressed = 0
+        if level >= PRINT_WARNING:
+            now = time.time()
+            with self.printLock:
+                lastPrinted, suppressed, lastArgs = self.printHistory.get(message, (None, 0, None))
+                if (lastPrinted is not None) and ((now - lastPrinted) < self.printRepeatInterval):
+                    self.printHistory[message] = (lastPrinted, suppressed + 1, args)
+                    if self.printTimer is None:
+                        self.StartPrintTimer(lastPrinted + self.printRepeatInterval - now)
+                    return
+                if (lastPrinted is None) and (len(self.printHistory) >= PRINT_HISTORY_LIMIT):
+                    # Forget messages which have not been seen for a while and have no repeats waiting
+                    for oldMessage, (oldPrinted, oldSuppressed, oldArgs) in list(self.printHistory.items()):
+                        if (oldSuppressed == 0) and ((now - oldPrinted) >= self.printRepeatInterval):
+                            del self.printHistory[oldMessage]
+                self.printHistory[message] = (now, 0, None)
+        self.PrintOut(message, args, suppressed)
+
+
+    def PrintOut(self, message, args, suppressed):
+        """
+PrintOut(message, args, suppressed)
+
+Formats and prints a message which has passed the rate limiting, with the count of repeats not shown
+        """
+        if args:
+            message = message % args
+        if suppressed > 0:
+            message = '%s (repeated %d times since last shown)' % (message, suppressed)
         if self.printFunction == None:
             print(message)
         else:
             self.printFunction(message)
 
 
+    def StartPrintTimer(self, delay):
+        """
+StartPrintTimer(delay)
+
+Calls FlushPrints after delay seconds, called with printLock held
+        """
+        self.printTimer = threading.Timer(max(delay, 0.0), self.FlushPrints)
+        self.printTimer.daemon = True
+        self.printTimer.start()
+
+
+    def FlushPrints(self, everything = False):
+        """
+FlushPrints([everything])
+
+Prints the count of repeats held back for each warning or error whose printRepeatInterval has passed,
+then forgets the messages which have not been seen for a while
+Called automatically after repeats are held back, call with everything True before a program ends to show every count
+        """
+        now = time.time()
+        summaries = []
+        with self.printLock:
+            self.printTimer = None
+            nextFlush = None
+            for message, (lastPrinted, suppressed, args) in list(self.printHistory.items()):
+                due = lastPrinted + self.printRepeatInterval
+                if suppressed > 0:
+                    if everything or (now >= due):
+                        summaries.append((message, args, suppressed))
+                        self.printHistory[message] = (now, 0, None)
+                    elif (nextFlush is None) or (due < nextFlush):
+                        nextFlush = due
+                elif now >= due:
+                    del self.printHistory[message]
+            if nextFlush is not None:
+                self.StartPrintTimer(nextFlush - now)
+        for message, args, suppressed in summaries:
+            self.PrintOut(message, args, suppressed)
+
+
     def NoPrint(self, message):
         """
 NoPrint(message)
@@ -309,13 +1475,15 @@ Prepare the I²C driver for talking to the RockyBorg
 If tryOtherBus is True, this function will attempt to use the other bus if the RockyBorg devices can not be found on the current busNumber
     This is only really useful for early Raspberry Pi models!
         """
-        self.Print('Loading RockyBorg on bus %d, address %02X' % (self.busNumber, self.i2cAddress))
+        self.Print('Loading RockyBorg on bus %d, address %02X', self.busNumber, self.i2cAddress)
 
         # Open the bus
         self.i2cRead = io.open("/dev/i2c-" + str(self.busNumber), "rb", buffering = 0)
         fcntl.ioctl(self.i2cRead, I2C_SLAVE, self.i2cAddress)
         self.i2cWrite = io.open("/dev/i2c-" + str(self.busNumber), "wb", buffering = 0)
         fcntl.ioctl(self.i2cWrite, I2C_SLAVE, self.i2cAddress)
+        self.busUsage = GetBusUsage(self.busNumber)
+        self.SetupTimeout()
 
         # Check for RockyBorg
         try:
@@ -323,18 +1491,18 @@ If tryOtherBus is True, this function will attempt to use the other bus if the R
             if len(i2cRecv) == I2C_MAX_LEN:
                 if i2cRecv[1] == I2C_ID_ROCKYBORG:
                     self.foundChip = True
-                    self.Print('Found RockyBorg at %02X' % (self.i2cAddress))
+                    self.Print('Found RockyBorg at %02X', self.i2cAddress)
                 else:
                     self.foundChip = False
-                    self.Print('Found a device at %02X, but it is not a RockyBorg (ID %02X instead of %02X)' % (self.i2cAddress, i2cRecv[1], I2C_ID_ROCKYBORG))
+                    self.Print('Found a device at %02X, but it is not a RockyBorg (ID %02X instead of %02X)', self.i2cAddress, i2cRecv[1], I2C_ID_ROCKYBORG)
             else:
                 self.foundChip = False
-                self.Print('Missing RockyBorg at %02X' % (self.i2cAddress))
+                self.Print('Missing RockyBorg at %02X', self.i2cAddress)
         except KeyboardInterrupt:
             raise
         except:
             self.foundChip = False
-            self.Print('Missing RockyBorg at %02X' % (self.i2cAddress))
+            self.Print('Missing RockyBorg at %02X', self.i2cAddress)
 
         # See if we are missing chips
         if not self.foundChip:
@@ -344,22 +1512,22 @@ If tryOtherBus is True, this function will attempt to use the other bus if the R
                     self.busNumber = 0
                 else:
                     self.busNumber = 1
-                self.Print('Trying bus %d instead' % (self.busNumber))
+                self.Print('Trying bus %d instead', self.busNumber)
                 self.Init(False)
             else:
                 self.Print('Are you sure your RockyBorg is properly attached, the correct address is used, and the I²C drivers are running?')
                 self.bus = None
         else:
-            self.Print('RockyBorg loaded on bus %d' % (self.busNumber))
+            self.Print('RockyBorg loaded on bus %d', self.busNumber)
 
         # Read the calibration settings from the RockyBorg
         self.SERVO_PWM_MIN = self.GetWithRetry(self.GetServoMinimum, 5)
         if self.SERVO_PWM_MIN is None:
-            self.Print('Error: Failed reading servo minimum, using default!')
+            self.PrintLevel(PRINT_WARNING, 'Error: Failed reading servo minimum, using default!')
             self.SERVO_PWM_MIN = DEFAULT_SERVO_PWM_MIN
         self.SERVO_PWM_MAX = self.GetWithRetry(self.GetServoMaximum, 5)
         if self.SERVO_PWM_MAX is None:
-            self.Print('Error: Failed reading servo maximum, using default!')
+            self.PrintLevel(PRINT_WARNING, 'Error: Failed reading servo maximum, using default!')
             self.SERVO_PWM_MAX = DEFAULT_SERVO_PWM_MAX
 
 
@@ -372,18 +1540,18 @@ Pass a get function with no parameters
 e.g.
 distance = GetWithRetry(RB.GetServoMinimum, 5)
 Will try RB.GetServoMinimum() upto 5 times, returning when it gets a value
-Useful for ensuring a read is successful
+A read which raises an exception or returns None (the Get functions return None when a read fails) is tried again
+Useful for ensuring a read is successful, returns None if every attempt failed
         """
         value = None
         for i in range(count):
-            okay = True
             try:
                 value = function()
             except KeyboardInterrupt:
                 raise
             except:
-                okay = False
-            if okay:
+                value = None
+            if value is not None:
                 break
         return value
 
@@ -417,9 +1585,9 @@ Useful for ensuring a write is successful
         return okay
 
 
-    def SetMotor2(self, power):
+    def SetMotor2(self, power, timeout = None):
         """
-SetMotor2(power)
+SetMotor2(power, [timeout])
 
 Sets the drive level for motor 2, from +1 to -1.
 e.g.
@@ -442,16 +1610,17 @@ SetMotor2(1)     -> motor 2 moving forward at 100% power
                 raise ValueError('Motor 2 power %f is above the +1.0 to -1.0 limits' % (power))
 
         try:
-            self.RawWrite(command, [pwm])
+            self.RawWrite(command, [pwm], timeout)
+            self.RecordSetpoints(motor2 = power)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed sending motor 2 drive level!')
+            self.PrintLevel(PRINT_ERROR, 'Failed sending motor 2 drive level!')
 
 
-    def GetMotor2(self):
+    def GetMotor2(self, timeout = None):
         """
-power = GetMotor2()
+power = GetMotor2([timeout])
 
 Gets the drive level for motor 2, from +1 to -1.
 e.g.
@@ -461,11 +1630,11 @@ e.g.
 1     -> motor 2 moving forward at 100% power
         """
         try:
-            i2cRecv = self.RawRead(COMMAND_GET_B, I2C_MAX_LEN)
+            i2cRecv = self.RawRead(COMMAND_GET_B, I2C_MAX_LEN, timeout = timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed reading motor 2 drive level!')
+            self.PrintLevel(PRINT_ERROR, 'Failed reading motor 2 drive level!')
             return
 
         power = float(i2cRecv[2]) / float(MOTOR_PWM_MAX)
@@ -478,9 +1647,9 @@ e.g.
             return
 
 
-    def SetMotor1(self, power):
+    def SetMotor1(self, power, timeout = None):
         """
-SetMotor1(power)
+SetMotor1(power, [timeout])
 
 Sets the drive level for motor 1, from +1 to -1.
 e.g.
@@ -503,16 +1672,17 @@ SetMotor1(1)     -> motor 1 moving forward at 100% power
                 raise ValueError('Motor 1 power %f is above the +1.0 to -1.0 limits' % (power))
 
         try:
-            self.RawWrite(command, [pwm])
+            self.RawWrite(command, [pwm], timeout)
+            self.RecordSetpoints(motor1 = power)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed sending motor 1 drive level!')
+            self.PrintLevel(PRINT_ERROR, 'Failed sending motor 1 drive level!')
 
 
-    def GetMotor1(self):
+    def GetMotor1(self, timeout = None):
         """
-power = GetMotor1()
+power = GetMotor1([timeout])
 
 Gets the drive level for motor 1, from +1 to -1.
 e.g.
@@ -522,11 +1692,11 @@ e.g.
 1     -> motor 1 moving forward at 100% power
         """
         try:
-            i2cRecv = self.RawRead(COMMAND_GET_A, I2C_MAX_LEN)
+            i2cRecv = self.RawRead(COMMAND_GET_A, I2C_MAX_LEN, timeout = timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed reading motor 1 drive level!')
+            self.PrintLevel(PRINT_ERROR, 'Failed reading motor 1 drive level!')
             return
 
         power = float(i2cRecv[2]) / float(MOTOR_PWM_MAX)
@@ -539,9 +1709,9 @@ e.g.
             return
 
 
-    def SetMotors(self, power):
+    def SetMotors(self, power, timeout = None):
         """
-SetMotors(power)
+SetMotors(power, [timeout])
 
 Sets the drive level for all motors, from +1 to -1.
 e.g.
@@ -564,30 +1734,32 @@ SetMotors(1)     -> all motors are moving forward at 100% power
                 raise ValueError('Motor power %f is above the +1.0 to -1.0 limits' % (power))
 
         try:
-            self.RawWrite(command, [pwm])
+            self.RawWrite(command, [pwm], timeout)
+            self.RecordSetpoints(motor1 = power, motor2 = power)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed sending all motors drive level!')
+            self.PrintLevel(PRINT_ERROR, 'Failed sending all motors drive level!')
 
 
-    def MotorsOff(self):
+    def MotorsOff(self, timeout = None):
         """
-MotorsOff()
+MotorsOff([timeout])
 
 Sets all motors to stopped, useful when ending a program
         """
         try:
-            self.RawWrite(COMMAND_ALL_OFF, [0])
+            self.RawWrite(COMMAND_ALL_OFF, [0], timeout)
+            self.RecordSetpoints(motor1 = 0.0, motor2 = 0.0)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed sending motors off command!')
+            self.PrintLevel(PRINT_ERROR, 'Failed sending motors off command!')
 
 
-    def SetLed(self, state):
+    def SetLed(self, state, timeout = None):
         """
-SetLed(state)
+SetLed(state, [timeout])
 
 Sets the current state of the LED, False for off, True for on
         """
@@ -597,25 +1769,26 @@ Sets the current state of the LED, False for off, True for on
             level = COMMAND_VALUE_OFF
 
         try:
-            self.RawWrite(COMMAND_SET_LED, [level])
+            self.RawWrite(COMMAND_SET_LED, [level], timeout)
+            self.RecordSetpoints(led = bool(state))
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed sending LED state!')
+            self.PrintLevel(PRINT_ERROR, 'Failed sending LED state!')
 
 
-    def GetLed(self):
+    def GetLed(self, timeout = None):
         """
-state = GetLed()
+state = GetLed([timeout])
 
 Reads the current state of the LED, False for off, True for on
         """ 
         try:
-            i2cRecv = self.RawRead(COMMAND_GET_LED, I2C_MAX_LEN)
+            i2cRecv = self.RawRead(COMMAND_GET_LED, I2C_MAX_LEN, timeout = timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed reading LED state!')
+            self.PrintLevel(PRINT_ERROR, 'Failed reading LED state!')
             return
 
         if i2cRecv[1] == COMMAND_VALUE_OFF:
@@ -624,9 +1797,55 @@ Reads the current state of the LED, False for off, True for on
             return True
 
 
-    def SetCommsFailsafe(self, state):
+    def SetLedPattern(self, pattern, code = None):
         """
-SetCommsFailsafe(state)
+SetLedPattern(pattern, [code])
+
+Plays a repeating pattern on the LED from a background thread, pattern is one of:
+    'off', 'solid', 'blink', 'heartbeat'    See LED_PATTERNS
+    'error'                                 Flashes code times then pauses
+    A list of (state, seconds) steps        Plays the steps in order, a time of None holds that step
+    None                                    Stops the pattern, leaving the LED as it is
+The LED is only written when it needs to change, it is never read from the board
+Setting the pattern which is already playing carries on without restarting it
+Call SetLedPattern(None) before using SetLed directly
+        """
+        if pattern is None:
+            steps = None
+        elif pattern == 'error':
+            steps = ErrorCodePattern(code)
+        elif isinstance(pattern, str):
+            if pattern not in LED_PATTERNS:
+                raise ValueError('Unknown LED pattern %s, use one of %s' % (pattern, ', '.join(sorted(LED_PATTERNS))))
+            steps = LED_PATTERNS[pattern]
+        else:
+            steps = list(pattern)
+
+        if self.ledPattern is None:
+            if steps is None:
+                return
+            self.ledPattern = LedPattern(self)
+        if steps != self.ledPattern.steps:
+            self.ledPattern.SetSteps(steps)
+
+
+    def StopLedPattern(self):
+        """
+StopLedPattern()
+
+Stops the background thread started by SetLedPattern, the LED is left as it is
+        """
+        ledPattern = self.ledPattern
+        if ledPattern is not None:
+            self.ledPattern = None
+            ledPattern.terminated = True
+            ledPattern.event.set()
+            ledPattern.join()
+
+
+    def SetCommsFailsafe(self, state, timeout = None):
+        """
+SetCommsFailsafe(state, [timeout])
 
 Sets the system to enable or disable the communications failsafe
 The failsafe will turn the motors off unless it is commanded at least once every 1/4 of a second
@@ -639,26 +1858,26 @@ The failsafe is disabled at power on
             level = COMMAND_VALUE_OFF
 
         try:
-            self.RawWrite(COMMAND_SET_FAILSAFE, [level])
+            self.RawWrite(COMMAND_SET_FAILSAFE, [level], timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed sending communications failsafe state!')
+            self.PrintLevel(PRINT_ERROR, 'Failed sending communications failsafe state!')
 
 
-    def GetCommsFailsafe(self):
+    def GetCommsFailsafe(self, timeout = None):
         """
-state = GetCommsFailsafe()
+state = GetCommsFailsafe([timeout])
 
 Read the current system state of the communications failsafe, True for enabled, False for disabled
 The failsafe will turn the motors off unless it is commanded at least once every 1/4 of a second
         """ 
         try:
-            i2cRecv = self.RawRead(COMMAND_GET_FAILSAFE, I2C_MAX_LEN)
+            i2cRecv = self.RawRead(COMMAND_GET_FAILSAFE, I2C_MAX_LEN, timeout = timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed reading communications failsafe state!')
+            self.PrintLevel(PRINT_ERROR, 'Failed reading communications failsafe state!')
             return
 
         if i2cRecv[1] == COMMAND_VALUE_OFF:
@@ -667,9 +1886,9 @@ The failsafe will turn the motors off unless it is commanded at least once every
             return True
 
 
-    def GetServoPosition(self):
+    def GetServoPosition(self, timeout = None):
         """
-position = GetServoPosition()
+position = GetServoPosition([timeout])
 
 Gets the drive position for the servo
 0 is central, -1 is maximum left, +1 is maximum right
@@ -680,11 +1899,11 @@ e.g.
 -0.75 -> 75% to the left
         """
         try:
-            i2cRecv = self.RawRead(COMMAND_GET_SERVO, I2C_MAX_LEN)
+            i2cRecv = self.RawRead(COMMAND_GET_SERVO, I2C_MAX_LEN, timeout = timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed reading servo output!')
+            self.PrintLevel(PRINT_ERROR, 'Failed reading servo output!')
             return
 
         pwmDuty = (i2cRecv[1] << 8) + i2cRecv[2]
@@ -692,9 +1911,9 @@ e.g.
         return (2.0 * powerOut) - 1.0
 
 
-    def SetServoPosition(self, position):
+    def SetServoPosition(self, position, timeout = None):
         """
-SetServoPosition(position)
+SetServoPosition(position, [timeout])
 
 Sets the drive position for the servo
 0 is central, -1 is maximum left, +1 is maximum right
@@ -712,16 +1931,17 @@ e.g.
         pwmDutyHigh = (pwmDuty >> 8) & 0xFF
 
         try:
-            self.RawWrite(COMMAND_SET_SERVO, [pwmDutyHigh, pwmDutyLow])
+            self.RawWrite(COMMAND_SET_SERVO, [pwmDutyHigh, pwmDutyLow], timeout)
+            self.RecordSetpoints(servoPosition = position)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed sending servo output!')
+            self.PrintLevel(PRINT_ERROR, 'Failed sending servo output!')
 
 
-    def GetServoMinimum(self):
+    def GetServoMinimum(self, timeout = None):
         """
-pwmLevel = GetServoMinimum()
+pwmLevel = GetServoMinimum([timeout])
 
 Gets the minimum PWM level for the servo
 This corresponds to position -1
@@ -733,19 +1953,19 @@ e.g.
 2500  -> 2.5 ms servo burst, higher than typical longest burst 
         """
         try:
-            i2cRecv = self.RawRead(COMMAND_GET_SERVO_MIN, I2C_MAX_LEN)
+            i2cRecv = self.RawRead(COMMAND_GET_SERVO_MIN, I2C_MAX_LEN, timeout = timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed reading servo minimum burst!')
+            self.PrintLevel(PRINT_ERROR, 'Failed reading servo minimum burst!')
             return
 
         return (i2cRecv[1] << 8) + i2cRecv[2]
 
 
-    def GetServoMaximum(self):
+    def GetServoMaximum(self, timeout = None):
         """
-pwmLevel = GetServoMaximum()
+pwmLevel = GetServoMaximum([timeout])
 
 Gets the maximum PWM level for the servo
 This corresponds to position +1
@@ -757,19 +1977,19 @@ e.g.
 2500  -> 2.5 ms servo burst, higher than typical longest burst 
         """
         try:
-            i2cRecv = self.RawRead(COMMAND_GET_SERVO_MAX, I2C_MAX_LEN)
+            i2cRecv = self.RawRead(COMMAND_GET_SERVO_MAX, I2C_MAX_LEN, timeout = timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed reading servo maximum burst!')
+            self.PrintLevel(PRINT_ERROR, 'Failed reading servo maximum burst!')
             return
 
         return (i2cRecv[1] << 8) + i2cRecv[2]
 
 
-    def GetServoStartup(self):
+    def GetServoStartup(self, timeout = None):
         """
-pwmLevel = GetServoStartup()
+pwmLevel = GetServoStartup([timeout])
 
 Gets the startup PWM level for the servo
 This can be anywhere in the minimum to maximum range
@@ -781,19 +2001,19 @@ e.g.
 2500  -> 2.5 ms servo burst, higher than typical longest burst 
         """
         try:
-            i2cRecv = self.RawRead(COMMAND_GET_SERVO_BOOT, I2C_MAX_LEN)
+            i2cRecv = self.RawRead(COMMAND_GET_SERVO_BOOT, I2C_MAX_LEN, timeout = timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed reading servo startup burst!')
+            self.PrintLevel(PRINT_ERROR, 'Failed reading servo startup burst!')
             return
 
         return (i2cRecv[1] << 8) + i2cRecv[2]
 
 
-    def CalibrateServoPosition(self, pwmLevel):
+    def CalibrateServoPosition(self, pwmLevel, timeout = None):
         """
-CalibrateServoPosition(pwmLevel)
+CalibrateServoPosition(pwmLevel, [timeout])
 
 Sets the raw PWM level for the servo
 This value can be set anywhere from 0 for a 0% duty cycle to 20000 for a 100% duty cycle.
@@ -814,16 +2034,16 @@ e.g.
         pwmDutyHigh = (pwmLevel >> 8) & 0xFF
 
         try:
-            self.RawWrite(COMMAND_CALIBRATE_SERVO, [pwmDutyHigh, pwmDutyLow])
+            self.RawWrite(COMMAND_CALIBRATE_SERVO, [pwmDutyHigh, pwmDutyLow], timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed sending calibration servo output!')
+            self.PrintLevel(PRINT_ERROR, 'Failed sending calibration servo output!')
 
 
-    def GetRawServoPosition(self):
+    def GetRawServoPosition(self, timeout = None):
         """
-pwmLevel = GetRawServoPosition()
+pwmLevel = GetRawServoPosition([timeout])
 
 Gets the raw PWM level for the servo
 This value can be set anywhere from 0 for a 0% duty cycle to 20000 for a 100% duty cycle.
@@ -840,20 +2060,20 @@ e.g.
 2500  -> 2.5 ms servo burst, higher than typical longest burst, 22.5% duty cycle
         """
         try:
-            i2cRecv = self.RawRead(COMMAND_GET_SERVO, I2C_MAX_LEN)
+            i2cRecv = self.RawRead(COMMAND_GET_SERVO, I2C_MAX_LEN, timeout = timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed reading raw servo output!')
+            self.PrintLevel(PRINT_ERROR, 'Failed reading raw servo output!')
             return
 
         pwmDuty = (i2cRecv[1] << 8) + i2cRecv[2]
         return pwmDuty
 
 
-    def SetServoMinimum(self, pwmLevel):
+    def SetServoMinimum(self, pwmLevel, timeout = None):
         """
-SetServoMinimum(pwmLevel)
+SetServoMinimum(pwmLevel, [timeout])
 
 Sets the minimum PWM level for the servo
 This corresponds to position -1
@@ -875,18 +2095,18 @@ e.g.
         pwmDutyHigh = (pwmLevel >> 8) & 0xFF
 
         try:
-            self.RawWrite(COMMAND_SET_SERVO_MIN, [pwmDutyHigh, pwmDutyLow])
+            self.RawWrite(COMMAND_SET_SERVO_MIN, [pwmDutyHigh, pwmDutyLow], timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed sending the servo minimum limit!')
+            self.PrintLevel(PRINT_ERROR, 'Failed sending the servo minimum limit!')
         time.sleep(DELAY_AFTER_EEPROM)
-        self.SERVO_PWM_MIN = self.GetServoMinimum()
+        self.SERVO_PWM_MIN = self.GetServoMinimum(timeout)
 
 
-    def SetServoMaximum(self, pwmLevel):
+    def SetServoMaximum(self, pwmLevel, timeout = None):
         """
-SetServoMaximum(pwmLevel)
+SetServoMaximum(pwmLevel, [timeout])
 
 Sets the maximum PWM level for the servo
 This corresponds to position +1
@@ -908,18 +2128,18 @@ e.g.
         pwmDutyHigh = (pwmLevel >> 8) & 0xFF
 
         try:
-            self.RawWrite(COMMAND_SET_SERVO_MAX, [pwmDutyHigh, pwmDutyLow])
+            self.RawWrite(COMMAND_SET_SERVO_MAX, [pwmDutyHigh, pwmDutyLow], timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed sending the servo maximum limit!')
+            self.PrintLevel(PRINT_ERROR, 'Failed sending the servo maximum limit!')
         time.sleep(DELAY_AFTER_EEPROM)
-        self.SERVO_PWM_MAX = self.GetServoMaximum()
+        self.SERVO_PWM_MAX = self.GetServoMaximum(timeout)
 
 
-    def SetServoStartup(self, pwmLevel):
+    def SetServoStartup(self, pwmLevel, timeout = None):
         """
-SetServoStartup(pwmLevel)
+SetServoStartup(pwmLevel, [timeout])
 
 Sets the startup PWM level for the servo
 This value can be set anywhere from 0 for a 0% duty cycle to 20000 for a 100% duty cycle.
@@ -959,17 +2179,17 @@ e.g.
             raise ValueError('Servo startup position %d is outside the limits of %d to %d' % (pwmLevel, self.SERVO_PWM_MIN, self.SERVO_PWM_MAX))
 
         try:
-            self.RawWrite(COMMAND_SET_SERVO_BOOT, [pwmDutyHigh, pwmDutyLow])
+            self.RawWrite(COMMAND_SET_SERVO_BOOT, [pwmDutyHigh, pwmDutyLow], timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed sending servo startup position!')
+            self.PrintLevel(PRINT_ERROR, 'Failed sending servo startup position!')
         time.sleep(DELAY_AFTER_EEPROM)
 
 
-    def SetMotorsEnabled(self, state):
+    def SetMotorsEnabled(self, state, timeout = None):
         """
-SetMotorsEnabled(state)
+SetMotorsEnabled(state, [timeout])
 
 Sets if the system is powering the motor drive pins
 If True all of the motor pins are either low, high, or PWMed (powered)
@@ -981,27 +2201,27 @@ If False all of the motor pins are tri-stated (unpowered)
             level = COMMAND_VALUE_OFF
 
         try:
-            self.RawWrite(COMMAND_SET_MOTORS_EN, [level])
+            self.RawWrite(COMMAND_SET_MOTORS_EN, [level], timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed sending motor drive enabled state!')
+            self.PrintLevel(PRINT_ERROR, 'Failed sending motor drive enabled state!')
 
 
-    def GetMotorsEnabled(self):
+    def GetMotorsEnabled(self, timeout = None):
         """
-state = GetMotorsEnabled()
+state = GetMotorsEnabled([timeout])
 
 Gets if the system is powering the motor drive pins
 If True all of the motor pins are either low, high, or PWMed (powered)
 If False all of the motor pins are tri-stated (unpowered)
         """ 
         try:
-            i2cRecv = self.RawRead(COMMAND_GET_MOTORS_EN, I2C_MAX_LEN)
+            i2cRecv = self.RawRead(COMMAND_GET_MOTORS_EN, I2C_MAX_LEN, timeout = timeout)
         except KeyboardInterrupt:
             raise
         except:
-            self.Print('Failed reading motor drive enabled state!')
+            self.PrintLevel(PRINT_ERROR, 'Failed reading motor drive enabled state!')
             return
 
         if i2cRecv[1] == COMMAND_VALUE_OFF:
@@ -1010,6 +2230,204 @@ If False all of the motor pins are tri-stated (unpowered)
             return True
 
 
+    def ReadConfiguration(self, count = 5):
+        """
+configuration = ReadConfiguration([count])
+
+Reads all of the stored settings for the board in one go, each read is tried up to count times
+Returns a dictionary with these keys, values which could not be read are None
+servoMinimum            See GetServoMinimum
+servoMaximum            See GetServoMaximum
+servoStartup            See GetServoStartup
+failsafe                See GetCommsFailsafe
+motorsEnabled           See GetMotorsEnabled
+        """
+        return {
+            'servoMinimum': self.GetWithRetry(self.GetServoMinimum, count),
+            'servoMaximum': self.GetWithRetry(self.GetServoMaximum, count),
+            'servoStartup': self.GetWithRetry(self.GetServoStartup, count),
+            'failsafe': self.GetWithRetry(self.GetCommsFailsafe, count),
+            'motorsEnabled': self.GetWithRetry(self.GetMotorsEnabled, count),
+        }
+
+
+    def WriteConfiguration(self, configuration, count = 5):
+        """
+worked = WriteConfiguration(configuration, [count])
+
+Writes the settings from a dictionary returned by ReadConfiguration to the board
+Keys which are missing or None are left unchanged
+All values are sent before waiting once for the EEPROM, then everything is read back in one pass
+Any values which do not match are sent again, up to count attempts in total
+Returns True if every value was read back correctly
+        """
+        servoMinimum = configuration.get('servoMinimum')
+        servoMaximum = configuration.get('servoMaximum')
+        servoStartup = configuration.get('servoStartup')
+        if (servoStartup is not None) and (servoStartup != PWM_UNSET) and (servoMinimum is not None) and (servoMaximum is not None):
+            if not (min(servoMinimum, servoMaximum) <= servoStartup <= max(servoMinimum, servoMaximum)):
+                raise ValueError('Servo startup position %d is outside the limits of %d to %d' % (servoStartup, servoMinimum, servoMaximum))
+
+        # Commands to send and the function to check each one with, limits go first so the startup is checked against them
+        pending = []
+        for key, command, getFunction in (
+                ('servoMinimum', COMMAND_SET_SERVO_MIN, self.GetServoMinimum),
+                ('servoMaximum', COMMAND_SET_SERVO_MAX, self.GetServoMaximum),
+                ('servoStartup', COMMAND_SET_SERVO_BOOT, self.GetServoStartup),
+                ('failsafe', COMMAND_SET_FAILSAFE, self.GetCommsFailsafe),
+                ('motorsEnabled', COMMAND_SET_MOTORS_EN, self.GetMotorsEnabled)):
+            value = configuration.get(key)
+            if value is None:
+                continue
+            elif command in CALIBRATION_COMMANDS:
+                data = [(value >> 8) & 0xFF, value & 0xFF]
+            elif value:
+                data = [COMMAND_VALUE_ON]
+            else:
+                data = [COMMAND_VALUE_OFF]
+            pending.append((command, data, getFunction, value))
+
+        for i in range(count):
+            if not pending:
+                break
+            eepromWritten = False
+            for command, data, getFunction, value in pending:
+                try:
+                    self.RawWrite(command, data)
+                except KeyboardInterrupt:
+                    raise
+                except:
+                    self.PrintLevel(PRINT_ERROR, 'Failed sending configuration command %d!', command)
+                if command in CALIBRATION_COMMANDS:
+                    eepromWritten = True
+            if eepromWritten:
+                time.sleep(DELAY_AFTER_EEPROM)
+            failed = []
+            for entry in pending:
+                if entry[2]() != entry[3]:
+                    failed.append(entry)
+            pending = failed
+
+        # Use the new limits straight away if they were read back correctly
+        failedCommands = [entry[0] for entry in pending]
+        if (servoMinimum is not None) and (COMMAND_SET_SERVO_MIN not in failedCommands):
+            self.SERVO_PWM_MIN = servoMinimum
+        if (servoMaximum is not None) and (COMMAND_SET_SERVO_MAX not in failedCommands):
+            self.SERVO_PWM_MAX = servoMaximum
+        return len(pending) == 0
+
+
+    def StartTelemetry(self, fastInterval = TELEMETRY_FAST_INTERVAL, slowInterval = TELEMETRY_SLOW_INTERVAL):
+        """
+telemetry = StartTelemetry([fastInterval], [slowInterval])
+
+Starts a background thread which reads the board state on a schedule, see the Telemetry class for details
+Waits for the first reading before returning so GetTelemetry has a value straight away
+Once started other code should use GetTelemetry instead of the Get functions so only one thread polls the bus
+        """
+        if self.telemetry is None:
+            self.telemetry = Telemetry(self, fastInterval, slowInterval)
+            self.telemetry.firstSweep.wait(TELEMETRY_START_TIMEOUT)
+        return self.telemetry
+
+
+    def StopTelemetry(self):
+        """
+StopTelemetry()
+
+Stops the background thread started by StartTelemetry
+        """
+        telemetry = self.telemetry
+        if telemetry is not None:
+            self.telemetry = None
+            telemetry.terminated = True
+            telemetry.event.set()
+            telemetry.join()
+
+
+    def GetTelemetry(self):
+        """
+snapshot = GetTelemetry()
+
+Returns the latest TelemetrySnapshot read by the background thread without using the I²C bus
+Returns EMPTY_TELEMETRY (sequence 0, every value None) if the first sweep has not finished yet
+Returns None if StartTelemetry has not been called
+e.g.
+snapshot = RB.GetTelemetry()
+if snapshot and snapshot.sequence:
+    print(snapshot.motor1, snapshot.servoPosition, time.time() - snapshot.timestamp)
+        """
+        telemetry = self.telemetry
+        if telemetry is None:
+            return None
+        snapshot = telemetry.snapshot
+        if snapshot is None:
+            return EMPTY_TELEMETRY
+        return snapshot
+
+
+    def GetBusStatistics(self):
+        """
+statistics = GetBusStatistics()
+
+Returns the I²C traffic sent to this board as a dictionary of {command: (transactions, bytes, busTime)}
+busTime is the estimated time in seconds the bus was in use, based on the clock set in busUsage
+Returns an empty dictionary if the bus has not been opened
+        """
+        if self.busUsage is None:
+            return {}
+        return self.busUsage.Statistics(self.i2cAddress)
+
+
+    def GetBatchFallbacks(self):
+        """
+batches, messages = GetBatchFallbacks()
+
+Returns how many batches sent by FlushBatch failed as a single transfer and were resent one write at a time,
+and how many writes those batches held, see SendBatch
+        """
+        if self.busUsage is None:
+            return 0, 0
+        return self.busUsage.Fallbacks(self.i2cAddress)
+
+
+    def GetBusUtilisation(self):
+        """
+fraction = GetBusUtilisation()
+
+Returns the estimated fraction of the time the I²C bus has been in use recently, 0.0 to 1.0
+This includes traffic for all RockyBorg boards on the same bus
+        """
+        if self.busUsage is None:
+            return 0.0
+        return self.busUsage.Utilisation()
+
+
+    def StartSharedState(self, name = SHARED_STATE_NAME):
+        """
+StartSharedState([name])
+
+Publishes the setpoints, telemetry and bus statistics for this board into a shared memory block
+Other processes on the Raspberry Pi can then read them with SharedStateReader without using the I²C bus
+The block is updated whenever a setpoint is sent and after each telemetry sweep, start telemetry to include readings
+Needs Python 3.8 or newer
+        """
+        if self.sharedState is None:
+            self.sharedState = SharedState(self, name)
+
+
+    def StopSharedState(self):
+        """
+StopSharedState()
+
+Stops publishing and removes the shared memory block created by StartSharedState
+        """
+        sharedState = self.sharedState
+        if sharedState is not None:
+            self.sharedState = None
+            sharedState.Close()
+
+
     def Help(self):
         """
 Help()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Reads back the dashcam recording made by rbWeb.py
+#
+# Show the time covered by each part of the recording:
+#   ./rbDashcam.py list /home/pi/dashcam
+# Save the frames from a time onwards as JPEG files, with the speed and steering in each name:
+#   ./rbDashcam.py save /home/pi/dashcam --start "2026-10-19 14:03:20" --seconds 30 --output incident
+# Save the last minute of the recording:
+#   ./rbDashcam.py save /home/pi/dashcam --last 60 --output incident
+#
+# The recording does not need to be stopped first, frames are only listed once they are safely written
+
+# Import library functions we need
+import argparse
+import bisect
+import datetime
+import glob
+import os
+import struct
+import sys
+import time
+
+# Settings for the recording, these must match rbWeb.py
+indexRecord = struct.Struct('<dIIff')   # Capture time, offset and length in the .mjpeg file, speed, steering
+
+
+# Reads the index of every segment, returns a list of (name, times, records) in time order
+def ReadSegments(directory):
+    segments = []
+    for indexName in glob.glob(os.path.join(directory, 'segment-*.index')):
+        with open(indexName, 'rb') as indexFile:
+            data = indexFile.read()
+        # Ignore a partly written record at the end
+        count = len(data) // indexRecord.size
+        records = [indexRecord.unpack_from(data, i * indexRecord.size) for i in range(count)]
+        if records:
+            times = [record[0] for record in records]
+            segments.append((indexName[:-len('.index')], times, records))
+    segments.sort(key = lambda segment: segment[1][0])
+    return segments
+
+
+# Returns (name, record) for every frame captured from startTime up to endTime
+def FindFrames(segments, startTime, endTime):
+    frames = []
+    for name, times, records in segments:
+        if (times[-1] < startTime) or (times[0] >= endTime):
+            continue
+        first = bisect.bisect_left(times, startTime)
+        last = bisect.bisect_left(times, endTime)
+        frames.extend([(name, record) for record in records[first:last]])
+    return frames
+
+
+def TimeText(seconds):
+    return datetime.datetime.fromtimestamp(seconds).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+def ListSegments(segments):
+    if not segments:
+        print('No recording found')
+        return
+    for name, times, records in segments:
+        print('%s  %s to %s  %5d frames' % (os.path.basename(name), TimeText(times[0]), TimeText(times[-1]), len(records)))
+    print('Recording covers %.0f seconds' % (segments[-1][1][-1] - segments[0][1][0]))
+
+
+def SaveFrames(frames, output):
+    if not os.path.isdir(output):
+        os.makedirs(output)
+    openName = None
+    dataFile = None
+    try:
+        for name, (captureTime, offset, length, speed, steering) in frames:
+            if name != openName:
+                if dataFile is not None:
+                    dataFile.close()
+                dataFile = open(name + '.mjpeg', 'rb')
+                openName = name
+            dataFile.seek(offset)
+            jpeg = dataFile.read(length)
+            frameName = '%s speed %+.2f steering %+.2f.jpg' % (TimeText(captureTime), speed, steering)
+            with open(os.path.join(output, frameName), 'wb') as frameFile:
+                frameFile.write(jpeg)
+    finally:
+        if dataFile is not None:
+            dataFile.close()
+    print('Saved %d frames to %s' % (len(frames), output))
+
+
+# if we are the main program (python was passed a script) run the requested task
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = 'Reads back the dashcam recording made by rbWeb.py')
+    parser.add_argument('task', choices = ['list', 'save'], help = 'list the recording, or save frames as JPEG files')
+    parser.add_argument('directory', help = 'dashcamDirectory used by rbWeb.py')
+    parser.add_argument('--start', help = 'local time of the first frame to save, e.g. "2026-10-19 14:03:20"')
+    parser.add_argument('--seconds', type = float, default = 10.0, help = 'length of time to save from --start')
+    parser.add_argument('--last', type = float, metavar = 'SECONDS', help = 'save the end of the recording instead')
+    parser.add_argument('--output', default = 'dashcam', help = 'directory to save the frames to')
+    args = parser.parse_args()
+
+    segments = ReadSegments(args.directory)
+    if args.task == 'list':
+        ListSegments(segments)
+    else:
+        if not segments:
+            print('No recording found')
+            sys.exit(1)
+        if args.last is not None:
+            endTime = segments[-1][1][-1] + 1.0
+            startTime = endTime - 1.0 - args.last
+        elif args.start is not None:
+            startTime = time.mktime(time.strptime(args.start, '%Y-%m-%d %H:%M:%S'))
+            endTime = startTime + args.seconds
+        else:
+            print('Give either --start or --last for the frames to save')
+            sys.exit(1)
+        frames = FindFrames(segments, startTime, endTime)
+        if not frames:
+            print('No frames recorded between %s and %s' % (TimeText(startTime), TimeText(endTime)))
+            sys.exit(1)
+        SaveFrames(frames, args.output)
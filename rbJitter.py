@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Measures how late a control loop wakes up with normal and real-time scheduling
+#
+# A loop like the one in rbJoystick.py runs at a fixed interval while other processes keep every CPU busy
+# The time between when each update should have happened and when it actually happened is recorded
+# The test is run twice, first with normal scheduling, then with RockyBorg.EnableRealTime
+#
+# Real-time scheduling needs permission, run with sudo for the second test to be meaningful
+
+# Import library functions we need
+import RockyBorg
+import multiprocessing
+import time
+import sys
+
+# Settings for the benchmark
+interval = 0.02                         # Time between control updates in seconds
+testDuration = 10.0                     # Time to run each test for in seconds
+loadProcesses = multiprocessing.cpu_count()  # Number of processes keeping the CPUs busy, 0 for no load
+realTimePriority = 50                   # SCHED_FIFO priority for the real-time test
+realTimeCpus = None                     # List of CPUs for the real-time test, e.g. [3], None for any
+useBoard = False                        # True to toggle the RockyBorg LED each update, False to run without a board
+
+
+# Busy loop used to load a CPU
+def BusyWork(stopEvent):
+    value = 0
+    while not stopEvent.is_set():
+        for i in range(10000):
+            value += i * i
+
+
+def Percentile(sortedValues, fraction):
+    if not sortedValues:
+        return 0.0
+    index = int(fraction * (len(sortedValues) - 1))
+    return sortedValues[index]
+
+
+# Runs the control loop, returns a sorted list of how late each update was in seconds
+def RunLoop(RB):
+    lateness = []
+    ledState = False
+    startTime = time.time()
+    nextUpdate = startTime + interval
+    endTime = startTime + testDuration
+    while nextUpdate < endTime:
+        delay = nextUpdate - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        lateness.append(time.time() - nextUpdate)
+        if RB is not None:
+            ledState = not ledState
+            RB.SetLed(ledState)
+        nextUpdate += interval
+    lateness.sort()
+    return lateness
+
+
+def Report(name, lateness):
+    missed = len([late for late in lateness if late > interval])
+    print('%-10s p50 %7.3f ms  p99 %7.3f ms  p99.9 %7.3f ms  max %7.3f ms  %d missed updates' % (
+            name, Percentile(lateness, 0.5) * 1000, Percentile(lateness, 0.99) * 1000,
+            Percentile(lateness, 0.999) * 1000, Percentile(lateness, 1.0) * 1000, missed))
+
+
+# if we are the main program (python was passed a script) run the benchmark
+if __name__ == "__main__":
+    RB = None
+    if useBoard:
+        RB = RockyBorg.RockyBorg()
+        RB.Init()
+        if not RB.foundChip:
+            print('No RockyBorg found, set useBoard to False to run without one')
+            sys.exit()
+
+    # Start the load
+    print('Starting %d load processes' % (loadProcesses))
+    stopEvent = multiprocessing.Event()
+    loaders = [multiprocessing.Process(target = BusyWork, args = (stopEvent,)) for i in range(loadProcesses)]
+    for loader in loaders:
+        loader.daemon = True
+        loader.start()
+
+    try:
+        # Normal scheduling
+        print('Running %.0f seconds with normal scheduling at %.0f Hz' % (testDuration, 1.0 / interval))
+        normal = RunLoop(RB)
+
+        # Real-time scheduling
+        report = RockyBorg.EnableRealTime(realTimePriority, realTimeCpus)
+        for message in report.messages:
+            print(message)
+        print('Running %.0f seconds with real-time scheduling at %.0f Hz' % (testDuration, 1.0 / interval))
+        realTime = RunLoop(RB)
+        RockyBorg.DisableRealTime()
+    except KeyboardInterrupt:
+        print('\nUser shutdown')
+        sys.exit()
+    finally:
+        stopEvent.set()
+        for loader in loaders:
+            loader.join()
+        if RB is not None:
+            RB.SetLed(False)
+
+    # Show the results
+    print('')
+    print('Wake-up lateness with %d load processes:' % (loadProcesses))
+    Report('Normal', normal)
+    Report('Real-time', realTime)
+    if not report.scheduler:
+        print('Warning: real-time scheduling was not enabled, both runs used normal scheduling')
@@ -18,6 +18,7 @@ buttonSlow = 'L2'                       # Joystick button for driving slowly whi
 slowFactor = 0.5                        # Speed to slow to when the drive slowly button is held, e.g. 0.5 would be half speed
 buttonExit = 'PS'                       # Joystick button to end the program
 interval = 0.05                         # Time between motor updates in seconds, smaller responds faster but uses more processor time
+realTime = False                        # True to give the motor update loop real-time priority (needs sudo)
 
 # Power settings
 voltageIn = 1.2 * 8                     # Total battery voltage to the RockyBorg
@@ -62,27 +63,27 @@ def exitButtonPressed():
 
 # Wait for a connection
 RB.MotorsOff()
-RB.SetLed(True)
-waitingToggle = True
+RB.SetLedPattern('blink')
 if not Gamepad.available():
     print('Please connect your gamepad...')
     while not Gamepad.available():
         time.sleep(interval * 4)
-        waitingToggle = not waitingToggle
-        if waitingToggle:
-            RB.SetLed(False)
-        else:
-            RB.SetLed(True)
 print('Gamepad connected')
 gamepad = gamepadType()
 
 # Start the background updating
 gamepad.startBackgroundUpdates()
-RB.SetLed(True)
+RB.SetLedPattern('solid')
 
 # Register the callback functions
 gamepad.addButtonPressedHandler(buttonExit, exitButtonPressed)
 
+# Give the motor update loop priority over other programs if requested
+if realTime:
+    report = RockyBorg.EnableRealTime()
+    for message in report.messages:
+        print(message)
+
 # Keep running while joystick updates are handled by the callbacks
 try:
     while running and gamepad.isConnected():
@@ -113,10 +114,14 @@ try:
             # Turning right
             driveRight *= 1.0 - (0.5 * steering)
 
-        # Set the motors to the new speeds and tilt the servo to steer
-        RB.SetMotor1(-driveLeft * maxPower)
-        RB.SetMotor2(driveRight * maxPower)
-        RB.SetServoPosition(servoPosition)
+        # Set the motors to the new speeds and tilt the servo to steer, sent together as one I²C transfer
+        RB.StartBatch()
+        try:
+            RB.SetMotor1(-driveLeft * maxPower)
+            RB.SetMotor2(driveRight * maxPower)
+            RB.SetServoPosition(servoPosition)
+        finally:
+            RB.FlushBatch()
 
         # Sleep for our motor change interval
         time.sleep(interval)
@@ -128,4 +133,8 @@ finally:
     RB.MotorsOff()
 
     # Turn the LED off indicate we have finished
+    RB.StopLedPattern()
     RB.SetLed(False)
+
+    # Show the count of any repeated warnings still being held back
+    RB.FlushPrints(True)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Shows what the RockyBorg is doing without using the I²C bus
+#
+# Another program must be controlling the RockyBorg and publishing its state, e.g.
+# rbWeb.py with publishState = True, or any script which calls RB.StartSharedState()
+# Any number of copies of this script can run at the same time
+
+# Import library functions we need
+import RockyBorg
+import time
+import sys
+
+# Settings for the monitor
+interval = 0.5                          # Time between updates in seconds
+stateName = RockyBorg.SHARED_STATE_NAME # Name used by the program publishing the state
+
+
+def FormatValue(value, scale = 100.0):
+    if value is None:
+        return '   -'
+    return '%+4.0f' % (value * scale)
+
+
+# Attach to the published state
+try:
+    reader = RockyBorg.SharedStateReader(stateName)
+except (OSError, IOError):
+    print('No RockyBorg state found, is the controlling program running with shared state enabled?')
+    sys.exit()
+
+try:
+    print('Press CTRL+C to quit')
+    print('         Set (%)              Read (%)              Bus')
+    print('   M1   M2 Servo LED     M1   M2 Servo LED   Age (s)   Use (%)')
+    while True:
+        sample = reader.Read()
+        if sample is not None:
+            if sample.telemetryTime is None:
+                age = '      -'
+            else:
+                age = '%7.2f' % (time.time() - sample.telemetryTime)
+            print(' %s %s  %s %s   %s %s  %s %s   %s   %6.1f' % (
+                    FormatValue(sample.setMotor1), FormatValue(sample.setMotor2), FormatValue(sample.setServoPosition),
+                    {None: '  -', True: ' on', False: 'off'}[sample.setLed],
+                    FormatValue(sample.motor1), FormatValue(sample.motor2), FormatValue(sample.servoPosition),
+                    {None: '  -', True: ' on', False: 'off'}[sample.led],
+                    age, 100.0 * sample.busUtilisation))
+        time.sleep(interval)
+except KeyboardInterrupt:
+    print('')
+finally:
+    reader.Close()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copies the stored RockyBorg settings from one board to many others
+#
+# Save the settings from a board to a file (board defaults to bus 1, address 52):
+#   ./rbProvision.py save robot.cfg [bus:address]
+# Write the settings from a file to several boards at once, then check them:
+#   ./rbProvision.py load robot.cfg 1:52 3:52 4:21
+# Write the settings to every board found on some buses:
+#   ./rbProvision.py load robot.cfg --scan 1 3 4
+# Check boards match a file without changing them:
+#   ./rbProvision.py verify robot.cfg 1:52 3:52
+#
+# Settings copied: servo minimum, maximum and startup, communications failsafe and motors enabled
+# Each board is handled by its own thread, so boards on different buses are set up at the same time
+
+# Import library functions we need
+import RockyBorg
+import argparse
+import json
+import threading
+import time
+import sys
+
+# Settings for provisioning
+retryCount = 5                          # Number of attempts for each read or write
+fileVersion = 1                         # Version number stored in the settings file
+configurationKeys = ['servoMinimum', 'servoMaximum', 'servoStartup', 'failsafe', 'motorsEnabled']
+
+
+# Reads a board description in the form bus:address, address is in hex
+def ParseBoard(text):
+    if ':' in text:
+        bus, address = text.split(':', 1)
+    else:
+        bus, address = RockyBorg.RockyBorg.busNumber, text
+    return int(bus), int(address, 16)
+
+
+def BoardName(board):
+    return '%d:%02X' % board
+
+
+# Opens a board, returns None if it cannot be found
+def OpenBoard(board):
+    RB = RockyBorg.RockyBorg()
+    RB.printFunction = RB.NoPrint
+    RB.busNumber, RB.i2cAddress = board
+    try:
+        RB.Init()
+    except KeyboardInterrupt:
+        raise
+    except:
+        return None
+    if not RB.foundChip:
+        return None
+    return RB
+
+
+def SaveConfiguration(fileName, board):
+    RB = OpenBoard(board)
+    if RB is None:
+        print('No RockyBorg found at %s' % (BoardName(board)))
+        return False
+    startTime = time.time()
+    configuration = RB.ReadConfiguration(retryCount)
+    elapsed = time.time() - startTime
+    missing = [key for key in configurationKeys if configuration[key] is None]
+    if missing:
+        print('Failed reading %s from %s' % (', '.join(missing), BoardName(board)))
+        return False
+    configuration['version'] = fileVersion
+    with open(fileName, 'w') as configFile:
+        configFile.write(json.dumps(configuration, sort_keys = True, separators = (',', ':')))
+        configFile.write('\n')
+    print('Saved settings from %s to %s in %.3f s' % (BoardName(board), fileName, elapsed))
+    return True
+
+
+def LoadConfiguration(fileName):
+    with open(fileName, 'r') as configFile:
+        configuration = json.loads(configFile.read())
+    if configuration.get('version') != fileVersion:
+        raise ValueError('%s is not a version %d settings file' % (fileName, fileVersion))
+    return dict((key, configuration.get(key)) for key in configurationKeys)
+
+
+# Thread which writes or checks the settings for a single board
+class ProvisionWorker(threading.Thread):
+    def __init__(self, board, configuration, write):
+        super(ProvisionWorker, self).__init__()
+        self.board = board
+        self.configuration = configuration
+        self.write = write
+        self.result = 'Not run'
+        self.okay = False
+        self.openTime = 0.0
+        self.settingsTime = 0.0
+        self.start()
+
+    def run(self):
+        # This method runs in a separate thread
+        startTime = time.time()
+        RB = OpenBoard(self.board)
+        self.openTime = time.time() - startTime
+        if RB is None:
+            self.result = 'Not found'
+            return
+        try:
+            startTime = time.time()
+            if self.write:
+                # Writes everything, waits once for the EEPROM, then checks everything once
+                self.okay = RB.WriteConfiguration(self.configuration, retryCount)
+            if not self.okay:
+                readBack = RB.ReadConfiguration(retryCount)
+                different = [key for key in configurationKeys
+                             if (self.configuration[key] is not None) and (readBack[key] != self.configuration[key])]
+                self.okay = (len(different) == 0)
+            self.settingsTime = time.time() - startTime
+        except KeyboardInterrupt:
+            raise
+        except Exception as e:
+            self.result = 'Failed: %s' % (e)
+            return
+        if self.okay:
+            self.result = 'OK'
+        else:
+            self.result = 'Mismatch: %s' % (', '.join(different))
+
+
+def ProvisionBoards(configuration, boards, write):
+    startTime = time.time()
+    workers = [ProvisionWorker(board, configuration, write) for board in boards]
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - startTime
+
+    # Report the results for each board
+    print('')
+    print('Board    Open (s)  Settings (s)  Result')
+    for worker in workers:
+        print('%-8s %8.3f  %12.3f  %s' % (BoardName(worker.board), worker.openTime, worker.settingsTime, worker.result))
+    okay = len([worker for worker in workers if worker.okay])
+    print('%d of %d boards OK in %.3f s' % (okay, len(workers), elapsed))
+    return okay == len(workers)
+
+
+# if we are the main program (python was passed a script) run the requested task
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = 'Copies the stored RockyBorg settings between boards')
+    parser.add_argument('task', choices = ['save', 'load', 'verify'], help = 'save from a board, load to boards, or verify boards')
+    parser.add_argument('file', help = 'settings file to save to or load from')
+    parser.add_argument('boards', nargs = '*', help = 'boards as bus:address, address in hex, e.g. 1:52')
+    parser.add_argument('--scan', nargs = '+', type = int, metavar = 'BUS', help = 'use every RockyBorg found on these buses')
+    args = parser.parse_args()
+
+    boards = [ParseBoard(text) for text in args.boards]
+    if args.scan:
+        for bus in args.scan:
+            boards.extend([(bus, address) for address in RockyBorg.ScanForRockyBorg(bus)])
+    if not boards:
+        boards = [(RockyBorg.RockyBorg.busNumber, RockyBorg.RockyBorg.i2cAddress)]
+
+    if args.task == 'save':
+        if len(boards) != 1:
+            print('Settings can only be saved from one board')
+            sys.exit(1)
+        okay = SaveConfiguration(args.file, boards[0])
+    else:
+        configuration = LoadConfiguration(args.file)
+        okay = ProvisionBoards(configuration, boards, args.task == 'load')
+    if not okay:
+        sys.exit(1)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Simulates the movement of many RockyBorgs at once, faster than real time
+#
+# Each robot takes the same commands as the RockyBorg library:
+#   motor 1 drives the left rear wheel (reversed, as wired in rbWeb.py and rbJoystick.py)
+#   motor 2 drives the right rear wheel
+#   the servo pivots the front of the body, which steers the robot like a tricycle
+# All of the robots are stepped together using NumPy, so thousands can be run in one go
+#
+# Use from a script, e.g.
+# import rbSimulator
+# robots = rbSimulator.RobotBatch(1000)
+# motor1, motor2, servo = rbSimulator.MixDrive(speed, steering)
+# robots.Command(motor1, motor2, servo)
+# robots.Step(0.01)
+# print(robots.x, robots.y, robots.heading)
+#
+# Or control a single simulated robot with the same calls as a real RockyBorg:
+# RB = robots.Robot(0)
+# RB.SetMotor1(-0.5)
+#
+# Run this script directly for a demonstration sweep of steering settings
+
+# Import library functions we need
+import numpy
+import math
+import time
+
+# Settings for the RockyBorg model
+wheelBase = 0.150                       # Distance from the rear axle to the front wheel in metres
+maxWheelSpeed = 0.70                    # Speed of a rear wheel at full motor power in metres per second
+maxSteeringAngle = math.radians(30)     # Pivot angle of the front wheel at a servo position of +1 or -1
+motorTimeConstant = 0.10                # Time in seconds for a wheel to cover 63% of a change in speed
+servoSlewRate = math.radians(300)       # Fastest the servo can move in radians per second
+steeringDeadband = 0.05                 # Steering below this does not slow the inside wheel, as in rbWeb.py
+
+
+def MixDrive(speed, steering, maxPower = 1.0):
+    """
+motor1, motor2, servo = MixDrive(speed, steering, [maxPower])
+
+Works out the motor and servo commands for a speed and steering, both -1 to +1
+This is the same mixing used by rbWeb.py and rbJoystick.py, but works on whole arrays at once
+The inside wheel is slowed by up to half when turning, maxPower limits the motor voltage
+    """
+    speed = numpy.clip(numpy.asarray(speed, dtype = float), -1.0, 1.0)
+    steering = numpy.clip(numpy.asarray(steering, dtype = float), -1.0, 1.0)
+    driveLeft = numpy.where(steering < -steeringDeadband, speed * (1.0 + (0.5 * steering)), speed)
+    driveRight = numpy.where(steering > +steeringDeadband, speed * (1.0 - (0.5 * steering)), speed)
+    return -driveLeft * maxPower, +driveRight * maxPower, steering
+
+
+# A group of simulated robots, all stepped at the same time
+class RobotBatch:
+    """
+Simulates count RockyBorgs together
+
+x, y                    Position of the middle of the rear axle in metres
+heading                 Direction of travel in radians, 0 is along +x, positive is anti-clockwise
+leftSpeed, rightSpeed   Current rear wheel speeds in metres per second
+steeringAngle           Current front pivot angle in radians, positive turns left
+motor1, motor2, servo   Latest commands, -1 to +1
+time                    Simulated time in seconds
+
+Any of the model settings (wheelBase, maxWheelSpeed, ...) can be given as an array to vary them between robots
+    """
+
+    def __init__(self, count, wheelBase = wheelBase, maxWheelSpeed = maxWheelSpeed,
+                 maxSteeringAngle = maxSteeringAngle, motorTimeConstant = motorTimeConstant, servoSlewRate = servoSlewRate):
+        self.count = count
+        self.wheelBase = numpy.asarray(wheelBase, dtype = float)
+        self.maxWheelSpeed = numpy.asarray(maxWheelSpeed, dtype = float)
+        self.maxSteeringAngle = numpy.asarray(maxSteeringAngle, dtype = float)
+        self.motorTimeConstant = numpy.asarray(motorTimeConstant, dtype = float)
+        self.servoSlewRate = numpy.asarray(servoSlewRate, dtype = float)
+        self.x = numpy.zeros(count)
+        self.y = numpy.zeros(count)
+        self.heading = numpy.zeros(count)
+        self.leftSpeed = numpy.zeros(count)
+        self.rightSpeed = numpy.zeros(count)
+        self.steeringAngle = numpy.zeros(count)
+        self.motor1 = numpy.zeros(count)
+        self.motor2 = numpy.zeros(count)
+        self.servo = numpy.zeros(count)
+        self.time = 0.0
+
+    def Command(self, motor1 = None, motor2 = None, servo = None):
+        """
+Command([motor1], [motor2], [servo])
+
+Sets the commands for every robot, each can be a single value or an array with a value per robot
+Commands which are not given are left as they are
+        """
+        if motor1 is not None:
+            self.motor1[:] = numpy.clip(motor1, -1.0, 1.0)
+        if motor2 is not None:
+            self.motor2[:] = numpy.clip(motor2, -1.0, 1.0)
+        if servo is not None:
+            self.servo[:] = numpy.clip(servo, -1.0, 1.0)
+
+    def Step(self, dt):
+        """
+Step(dt)
+
+Moves every robot forward by dt seconds
+        """
+        # Wheels follow the motor commands with a first order lag, motor 1 is wired in reverse
+        blend = 1.0 - numpy.exp(-dt / self.motorTimeConstant)
+        self.leftSpeed += (-self.motor1 * self.maxWheelSpeed - self.leftSpeed) * blend
+        self.rightSpeed += (+self.motor2 * self.maxWheelSpeed - self.rightSpeed) * blend
+
+        # The servo moves towards its position at a limited rate, servo +1 turns right
+        target = -self.servo * self.maxSteeringAngle
+        maxMove = self.servoSlewRate * dt
+        self.steeringAngle += numpy.clip(target - self.steeringAngle, -maxMove, maxMove)
+
+        # Tricycle model, the front wheel cannot slide sideways so it sets the turning rate
+        # Any difference between the rear wheels only changes how much they slip
+        speed = 0.5 * (self.leftSpeed + self.rightSpeed)
+        turnRate = speed * numpy.tan(self.steeringAngle) / self.wheelBase
+        halfTurn = 0.5 * turnRate * dt
+        self.x += speed * numpy.cos(self.heading + halfTurn) * dt
+        self.y += speed * numpy.sin(self.heading + halfTurn) * dt
+        self.heading += turnRate * dt
+        self.time += dt
+
+    def Run(self, controller, duration, dt = 0.01):
+        """
+Run(controller, duration, [dt])
+
+Steps every robot for duration seconds, calling controller(batch) before each step
+The controller should call Command (or the SimulatedRobot functions) to set the next commands
+        """
+        steps = int(round(duration / dt))
+        for i in range(steps):
+            controller(self)
+            self.Step(dt)
+
+    def Robot(self, index):
+        """
+RB = Robot(index)
+
+Returns a SimulatedRobot which controls one robot in the batch with the RockyBorg functions
+        """
+        return SimulatedRobot(self, index)
+
+
+# One robot in a batch, with the same drive functions as the RockyBorg library
+class SimulatedRobot:
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+        self.led = False
+
+    def CheckPower(self, power, name):
+        if (power < -1.0) or (power > 1.0):
+            raise ValueError('%s power %f is outside the +1.0 to -1.0 limits' % (name, power))
+
+    def SetMotor1(self, power, timeout = None):
+        self.CheckPower(power, 'Motor 1')
+        self.batch.motor1[self.index] = power
+
+    def GetMotor1(self, timeout = None):
+        return float(self.batch.motor1[self.index])
+
+    def SetMotor2(self, power, timeout = None):
+        self.CheckPower(power, 'Motor 2')
+        self.batch.motor2[self.index] = power
+
+    def GetMotor2(self, timeout = None):
+        return float(self.batch.motor2[self.index])
+
+    def SetMotors(self, power, timeout = None):
+        self.CheckPower(power, 'Motor')
+        self.batch.motor1[self.index] = power
+        self.batch.motor2[self.index] = power
+
+    def MotorsOff(self, timeout = None):
+        self.batch.motor1[self.index] = 0.0
+        self.batch.motor2[self.index] = 0.0
+
+    def SetServoPosition(self, position, timeout = None):
+        if (position < -1.0) or (position > +1.0):
+            raise ValueError('Servo position %f is outside the +1.0 to -1.0 limits' % (position))
+        self.batch.servo[self.index] = position
+
+    def GetServoPosition(self, timeout = None):
+        return float(self.batch.servo[self.index])
+
+    def SetLed(self, state, timeout = None):
+        self.led = bool(state)
+
+    def GetLed(self, timeout = None):
+        return self.led
+
+    def StartBatch(self):
+        pass
+
+    def FlushBatch(self):
+        return []
+
+    def GetPose(self):
+        """
+x, y, heading = GetPose()
+
+Returns the position in metres and heading in radians of this robot
+        """
+        batch = self.batch
+        return float(batch.x[self.index]), float(batch.y[self.index]), float(batch.heading[self.index])
+
+
+# if we are the main program (python was passed a script) run a demonstration
+if __name__ == "__main__":
+    # Sweep every steering setting from hard left to hard right at full speed
+    robotCount = 10000
+    duration = 60.0
+    dt = 0.01
+    speed = numpy.ones(robotCount)
+    steering = numpy.linspace(-1.0, 1.0, robotCount)
+    robots = RobotBatch(robotCount)
+    motor1, motor2, servo = MixDrive(speed, steering)
+
+    print('Simulating %d robots for %.0f seconds in %.0f ms steps' % (robotCount, duration, dt * 1000))
+    startTime = time.time()
+    robots.Run(lambda batch: batch.Command(motor1, motor2, servo), duration, dt)
+    elapsed = time.time() - startTime
+    print('Took %.2f seconds, %.0f times faster than real time for each robot' % (elapsed, duration / elapsed))
+    print('%.1f million robot seconds per second' % ((robotCount * duration / elapsed) / 1e6))
+
+    # Turning circles, found from the distance travelled and the total turn
+    print('')
+    print('Steering  Turn radius (m)')
+    distance = duration * 0.5 * (robots.leftSpeed + robots.rightSpeed)
+    for steer in [-1.0, -0.5, -0.1, 0.1, 0.5, 1.0]:
+        index = int(round((steer + 1.0) / 2.0 * (robotCount - 1)))
+        turned = abs(robots.heading[index])
+        if turned > 1e-6:
+            print('%+8.2f  %.3f' % (steering[index], distance[index] / turned))
+        else:
+            print('%+8.2f  straight' % (steering[index]))
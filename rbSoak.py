@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Stress tests the RockyBorg library from many threads at once
+#
+# No board is needed, the RockyBorg is replaced by a simulated board which can:
+#   delay each transfer       - like a slow or busy bus
+#   reply to the wrong command - like a corrupted or missed transfer
+#   raise I/O errors          - like a disconnected or noisy bus
+#
+# Each thread makes a random mix of Set, Get and calibration calls
+# The Set calls only print their errors, so the simulated board tells each thread if any of its transfers failed
+# At the end the throughput, latency, read retry and failure rates are reported,
+# along with any invariant violations seen by the simulated board:
+#   a reply read by a different thread to the one which sent the command
+#   a servo PWM level outside of SERVO_PWM_MIN to SERVO_PWM_MAX
+#
+# Before the stress test the call timeouts are checked against a simulated board which never answers
+#
+# Not covered: the simulated board is not a device file, so the stress test cannot reach
+#   the I2C_RDWR transfer used by FlushBatch - every batch is sent by its one write at a time fallback
+#   waiting on a timeout with poll - only the timeout check above uses it, with the board never answering
+
+# Import library functions we need
+import RockyBorg
+import random
+import threading
+import time
+import sys
+import io
+import os
+
+# Settings for the stress test
+threadCount = 8                         # Number of threads calling the RockyBorg at the same time
+testDuration = 30.0                     # Time to run the test for in seconds
+reportInterval = 5.0                    # Time between progress reports in seconds
+latencyMax = 0.0005                     # Longest delay added to each transfer in seconds
+mismatchRate = 0.01                     # Chance of replying to the wrong command (0 to 1)
+errorRate = 0.002                       # Chance of an I/O error for each transfer (0 to 1)
+useTelemetry = True                     # True to run the telemetry thread alongside the test threads
+servoPwmMin = 1100                      # Servo minimum stored in the simulated board
+servoPwmMax = 1900                      # Servo maximum stored in the simulated board
+deadlineTimeout = 0.1                   # Timeout used when checking calls to a board which never answers
+deadlineSlack = 0.05                    # Extra time allowed past the timeout before the check fails
+
+
+# Simulated RockyBorg, used in place of the I²C device files
+class SimulatedRockyBorg:
+    def __init__(self, latencyMax = 0.0, mismatchRate = 0.0, errorRate = 0.0):
+        self.latencyMax = latencyMax
+        self.mismatchRate = mismatchRate
+        self.errorRate = errorRate
+        self.lock = threading.Lock()
+        self.random = random.Random()
+        self.pendingCommand = None
+        self.pendingThread = None
+        self.mismatchedThreads = {}
+        self.calls = threading.local()
+        self.registers = {
+            RockyBorg.COMMAND_GET_ID:           [RockyBorg.I2C_ID_ROCKYBORG, 0],
+            RockyBorg.COMMAND_GET_LED:          [RockyBorg.COMMAND_VALUE_OFF, 0],
+            RockyBorg.COMMAND_GET_A:            [RockyBorg.COMMAND_VALUE_FWD, 0],
+            RockyBorg.COMMAND_GET_B:            [RockyBorg.COMMAND_VALUE_FWD, 0],
+            RockyBorg.COMMAND_GET_FAILSAFE:     [RockyBorg.COMMAND_VALUE_OFF, 0],
+            RockyBorg.COMMAND_GET_MOTORS_EN:    [RockyBorg.COMMAND_VALUE_ON, 0],
+            RockyBorg.COMMAND_GET_SERVO:        [0x05, 0xDC],
+            RockyBorg.COMMAND_GET_SERVO_MIN:    [(servoPwmMin >> 8) & 0xFF, servoPwmMin & 0xFF],
+            RockyBorg.COMMAND_GET_SERVO_MAX:    [(servoPwmMax >> 8) & 0xFF, servoPwmMax & 0xFF],
+            RockyBorg.COMMAND_GET_SERVO_BOOT:   [0xFF, 0xFF],
+        }
+        # Counters
+        self.writes = 0
+        self.reads = 0
+        self.injectedMismatches = 0
+        self.injectedErrors = 0
+        self.readRetries = 0
+        self.violations = []
+
+    def Delay(self):
+        if self.latencyMax > 0:
+            time.sleep(self.random.uniform(0, self.latencyMax))
+
+    def AddViolation(self, text):
+        # Called with lock held, keeps the first 100 violations
+        if len(self.violations) < 100:
+            self.violations.append(text)
+
+    def StartCall(self):
+        # Forgets any failed transfers by this thread, call before each Set call
+        self.calls.failed = False
+
+    def CallFailed(self):
+        # True if a transfer by this thread has failed since StartCall
+        return getattr(self.calls, 'failed', False)
+
+    def GetPwm(self, command):
+        high, low = self.registers[command]
+        return (high << 8) + low
+
+    def write(self, data):
+        data = bytearray(data)
+        self.Delay()
+        with self.lock:
+            self.writes += 1
+            if self.random.random() < self.errorRate:
+                self.injectedErrors += 1
+                self.calls.failed = True
+                raise IOError('Simulated I²C write failure')
+            command = data[0]
+            if command in RockyBorg.GET_COMMANDS:
+                # Reply waiting to be read, asking again after a wrong reply is a retry
+                writer = threading.current_thread().name
+                if self.mismatchedThreads.pop(writer, None) == command:
+                    self.readRetries += 1
+                self.pendingCommand = command
+                self.pendingThread = writer
+                return len(data)
+            value = list(data[1:])
+            if command == RockyBorg.COMMAND_SET_LED:
+                self.registers[RockyBorg.COMMAND_GET_LED] = [value[0], 0]
+            elif command == RockyBorg.COMMAND_SET_A_FWD:
+                self.registers[RockyBorg.COMMAND_GET_A] = [RockyBorg.COMMAND_VALUE_FWD, value[0]]
+            elif command == RockyBorg.COMMAND_SET_A_REV:
+                self.registers[RockyBorg.COMMAND_GET_A] = [RockyBorg.COMMAND_VALUE_REV, value[0]]
+            elif command == RockyBorg.COMMAND_SET_B_FWD:
+                self.registers[RockyBorg.COMMAND_GET_B] = [RockyBorg.COMMAND_VALUE_FWD, value[0]]
+            elif command == RockyBorg.COMMAND_SET_B_REV:
+                self.registers[RockyBorg.COMMAND_GET_B] = [RockyBorg.COMMAND_VALUE_REV, value[0]]
+            elif command == RockyBorg.COMMAND_ALL_OFF:
+                self.registers[RockyBorg.COMMAND_GET_A] = [RockyBorg.COMMAND_VALUE_FWD, 0]
+                self.registers[RockyBorg.COMMAND_GET_B] = [RockyBorg.COMMAND_VALUE_FWD, 0]
+            elif command == RockyBorg.COMMAND_SET_SERVO:
+                pwmLevel = (value[0] << 8) + value[1]
+                pwmMin = self.GetPwm(RockyBorg.COMMAND_GET_SERVO_MIN)
+                pwmMax = self.GetPwm(RockyBorg.COMMAND_GET_SERVO_MAX)
+                if (pwmLevel < min(pwmMin, pwmMax)) or (pwmLevel > max(pwmMin, pwmMax)):
+                    self.AddViolation('Servo PWM %d outside of %d to %d' % (pwmLevel, pwmMin, pwmMax))
+                self.registers[RockyBorg.COMMAND_GET_SERVO] = value[:2]
+            elif command == RockyBorg.COMMAND_CALIBRATE_SERVO:
+                self.registers[RockyBorg.COMMAND_GET_SERVO] = value[:2]
+            elif command == RockyBorg.COMMAND_SET_SERVO_MIN:
+                self.registers[RockyBorg.COMMAND_GET_SERVO_MIN] = value[:2]
+            elif command == RockyBorg.COMMAND_SET_SERVO_MAX:
+                self.registers[RockyBorg.COMMAND_GET_SERVO_MAX] = value[:2]
+            elif command == RockyBorg.COMMAND_SET_SERVO_BOOT:
+                self.registers[RockyBorg.COMMAND_GET_SERVO_BOOT] = value[:2]
+            elif command == RockyBorg.COMMAND_SET_FAILSAFE:
+                self.registers[RockyBorg.COMMAND_GET_FAILSAFE] = [value[0], 0]
+            elif command == RockyBorg.COMMAND_SET_MOTORS_EN:
+                self.registers[RockyBorg.COMMAND_GET_MOTORS_EN] = [value[0], 0]
+        return len(data)
+
+    def read(self, length):
+        self.Delay()
+        with self.lock:
+            self.reads += 1
+            if self.random.random() < self.errorRate:
+                self.injectedErrors += 1
+                self.calls.failed = True
+                raise IOError('Simulated I²C read failure')
+            command = self.pendingCommand
+            if command is None:
+                return bytes(bytearray(length))
+            reader = threading.current_thread().name
+            if reader != self.pendingThread:
+                self.AddViolation('Reply to command %d sent by %s was read by %s' % (command, self.pendingThread, reader))
+            reply = [command] + self.registers[command]
+            if self.random.random() < self.mismatchRate:
+                self.injectedMismatches += 1
+                self.mismatchedThreads[reader] = command
+                reply[0] = (command + 1) & 0xFF
+        reply = (reply + [0] * length)[:length]
+        return bytes(bytearray(reply))
+
+
+# Simulated RockyBorg which accepts commands but never replies, built from pipes so poll works on it
+def OpenHungBoard():
+    replyRead, replyWrite = os.pipe()
+    commandRead, commandWrite = os.pipe()
+    RB = RockyBorg.RockyBorg()
+    RB.printFunction = RB.NoPrint
+    RB.i2cRead = io.open(replyRead, 'rb', buffering = 0)
+    RB.i2cWrite = io.open(commandWrite, 'wb', buffering = 0)
+    RockyBorg.SetNonBlocking(RB.i2cRead)
+    RockyBorg.SetNonBlocking(RB.i2cWrite)
+    RB.foundChip = True
+    RB.unusedFiles = [io.open(replyWrite, 'wb', buffering = 0), io.open(commandRead, 'rb', buffering = 0)]
+    return RB
+
+
+def CloseHungBoard(RB):
+    for i2cFile in [RB.i2cRead, RB.i2cWrite] + RB.unusedFiles:
+        i2cFile.close()
+
+
+# Checks a call finishes within the timeout, expecting it to raise BusTimeoutError if raises is True
+def CheckDeadline(name, function, raises):
+    startTime = time.time()
+    try:
+        function()
+        timedOut = False
+    except RockyBorg.BusTimeoutError:
+        timedOut = True
+    elapsed = time.time() - startTime
+    okay = (elapsed <= deadlineTimeout + deadlineSlack) and (timedOut == raises)
+    if okay:
+        result = 'OK'
+    else:
+        result = 'FAILED'
+    print('%-44s %7.3f s  %s' % (name, elapsed, result))
+    return okay
+
+
+def RunDeadlineCheck():
+    print('Checking timeouts of %.3f s against a board which never answers' % (deadlineTimeout))
+    RB = OpenHungBoard()
+    RB.timeout = deadlineTimeout
+    okay = True
+    okay &= CheckDeadline('RawRead raises BusTimeoutError', lambda: RB.RawRead(RockyBorg.COMMAND_GET_LED, RockyBorg.I2C_MAX_LEN), True)
+    okay &= CheckDeadline('GetLed returns None', RB.GetLed, False)
+    okay &= CheckDeadline('GetMotor1 with its own timeout', lambda: RB.GetMotor1(deadlineTimeout), False)
+
+    # Another thread stuck waiting for a reply keeps the bus busy
+    RB.timeout = None
+    blocker = threading.Thread(target = RB.GetLed, args = (deadlineTimeout * 5,))
+    blocker.start()
+    time.sleep(deadlineTimeout / 5)
+    okay &= CheckDeadline('RawWrite waiting for a busy bus', lambda: RB.RawWrite(RockyBorg.COMMAND_SET_LED, [1], deadlineTimeout), True)
+    okay &= CheckDeadline('SetMotor1 waiting for a busy bus', lambda: RB.SetMotor1(0.5, deadlineTimeout), False)
+    blocker.join()
+    CloseHungBoard(RB)
+    print('')
+    return okay
+
+
+# Runs a Set call, returns False if the simulated board saw any of its transfers fail
+def CheckedSet(RB, function, *args):
+    RB.i2cWrite.StartCall()
+    function(*args)
+    return not RB.i2cWrite.CallFailed()
+
+
+# Operations picked at random by each test thread
+def OpSetMotor1(RB, rng):
+    return CheckedSet(RB, RB.SetMotor1, rng.uniform(-1, 1))
+
+def OpSetMotor2(RB, rng):
+    return CheckedSet(RB, RB.SetMotor2, rng.uniform(-1, 1))
+
+def OpSetServo(RB, rng):
+    return CheckedSet(RB, RB.SetServoPosition, rng.uniform(-1, 1))
+
+def OpSetLed(RB, rng):
+    return CheckedSet(RB, RB.SetLed, rng.random() < 0.5)
+
+def OpDriveBatch(RB, rng):
+    RB.StartBatch()
+    try:
+        RB.SetMotor1(rng.uniform(-1, 1))
+        RB.SetMotor2(rng.uniform(-1, 1))
+        RB.SetServoPosition(rng.uniform(-1, 1))
+    finally:
+        errors = RB.FlushBatch()
+    return not any(errors)
+
+def OpGetMotor1(RB, rng):
+    return RB.GetMotor1() is not None
+
+def OpGetMotor2(RB, rng):
+    return RB.GetMotor2() is not None
+
+def OpGetServo(RB, rng):
+    return RB.GetServoPosition() is not None
+
+def OpGetLed(RB, rng):
+    return RB.GetLed() is not None
+
+def OpGetCalibration(RB, rng):
+    return ((RB.GetServoMinimum() is not None) and
+            (RB.GetServoMaximum() is not None) and
+            (RB.GetServoStartup() is not None))
+
+def OpCalibrateServo(RB, rng):
+    return CheckedSet(RB, RB.CalibrateServoPosition, rng.randint(servoPwmMin, servoPwmMax))
+
+def OpSetServoStartup(RB, rng):
+    return CheckedSet(RB, RB.SetServoStartup, rng.randint(servoPwmMin, servoPwmMax))
+
+# Weighted mix of operations, drive commands are by far the most common
+operations = [
+    (OpSetMotor1, 10), (OpSetMotor2, 10), (OpSetServo, 10), (OpDriveBatch, 10), (OpSetLed, 2),
+    (OpGetMotor1, 5), (OpGetMotor2, 5), (OpGetServo, 5), (OpGetLed, 2),
+    (OpGetCalibration, 1), (OpCalibrateServo, 1), (OpSetServoStartup, 1),
+]
+
+
+# Test thread
+class SoakWorker(threading.Thread):
+    def __init__(self, RB, endTime, seed):
+        super(SoakWorker, self).__init__()
+        self.RB = RB
+        self.endTime = endTime
+        self.random = random.Random(seed)
+        self.latencies = []
+        self.calls = 0
+        self.failures = 0
+        self.exceptions = 0
+        self.weighted = []
+        for operation, weight in operations:
+            self.weighted.extend([operation] * weight)
+
+    def run(self):
+        # This method runs in a separate thread
+        while time.time() < self.endTime:
+            operation = self.random.choice(self.weighted)
+            start = time.time()
+            try:
+                okay = operation(self.RB, self.random)
+            except KeyboardInterrupt:
+                raise
+            except Exception:
+                okay = False
+                self.exceptions += 1
+            self.latencies.append(time.time() - start)
+            self.calls += 1
+            if not okay:
+                self.failures += 1
+
+
+def Percentile(sortedValues, fraction):
+    if not sortedValues:
+        return 0.0
+    index = int(fraction * (len(sortedValues) - 1))
+    return sortedValues[index]
+
+
+def RunSoak():
+    # Set up a RockyBorg talking to the simulated board
+    device = SimulatedRockyBorg(latencyMax, mismatchRate, errorRate)
+    RB = RockyBorg.RockyBorg()
+    RB.printFunction = RB.NoPrint
+    RB.i2cRead = device
+    RB.i2cWrite = device
+    RB.foundChip = True
+    RB.busUsage = RockyBorg.BusUsage(RB.busNumber)
+    RB.SERVO_PWM_MIN = servoPwmMin
+    RB.SERVO_PWM_MAX = servoPwmMax
+    if useTelemetry:
+        RB.StartTelemetry()
+
+    # Run the test threads
+    print('Running %d threads for %.0f seconds' % (threadCount, testDuration))
+    startTime = time.time()
+    endTime = startTime + testDuration
+    workers = [SoakWorker(RB, endTime, seed) for seed in range(threadCount)]
+    for worker in workers:
+        worker.start()
+    try:
+        while any(worker.is_alive() for worker in workers):
+            time.sleep(min(reportInterval, max(0.1, endTime - time.time())))
+            elapsed = time.time() - startTime
+            calls = sum(worker.calls for worker in workers)
+            print('%6.1f s: %d calls, %.0f calls/s, %d violations' % (elapsed, calls, calls / elapsed, len(device.violations)))
+    except KeyboardInterrupt:
+        print('\nUser shutdown')
+        for worker in workers:
+            worker.endTime = 0
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - startTime
+    RB.StopTelemetry()
+
+    # Report the results
+    latencies = []
+    for worker in workers:
+        latencies.extend(worker.latencies)
+    latencies.sort()
+    calls = len(latencies)
+    failures = sum(worker.failures for worker in workers)
+    exceptions = sum(worker.exceptions for worker in workers)
+    transactions = device.writes + device.reads
+    print('')
+    print('=== Results ===')
+    print('Calls:            %d in %.1f s (%.0f calls/s)' % (calls, elapsed, calls / elapsed))
+    print('Latency:          p50 %.3f ms, p99 %.3f ms, p99.9 %.3f ms, max %.3f ms' % (
+            Percentile(latencies, 0.5) * 1000, Percentile(latencies, 0.99) * 1000,
+            Percentile(latencies, 0.999) * 1000, Percentile(latencies, 1.0) * 1000))
+    batches, batchWrites = RB.GetBatchFallbacks()
+    print('Transfers:        %d writes, %d reads' % (device.writes, device.reads))
+    print('Injected faults:  %d wrong replies, %d I/O errors (%.2f%% of transfers)' % (
+            device.injectedMismatches, device.injectedErrors, (100.0 * device.injectedErrors) / max(1, transactions)))
+    print('Read retries:     %d (%.2f%% of reads)' % (device.readRetries, (100.0 * device.readRetries) / max(1, device.reads)))
+    print('Failed calls:     %d (%.2f%%), %d raised exceptions' % (failures, (100.0 * failures) / max(1, calls), exceptions))
+    print('Batches:          %d sent one write at a time (%d writes)' % (batches, batchWrites))
+    print('Not covered:      I2C_RDWR batch transfers and poll timeouts under load, the simulated board has no device file')
+    print('Bus utilisation:  %.1f%% at %d Hz (estimated)' % (100.0 * RB.GetBusUtilisation(), RB.busUsage.clock))
+    if device.violations:
+        print('Invariant violations: %d' % (len(device.violations)))
+        for violation in device.violations[:20]:
+            print('    %s' % (violation))
+        return False
+    else:
+        print('Invariant violations: none')
+        return True
+
+
+# if we are the main program (python was passed a script) run the test
+if __name__ == "__main__":
+    deadlinesOkay = RunDeadlineCheck()
+    soakOkay = RunSoak()
+    if not (deadlinesOkay and soakOkay):
+        sys.exit(1)
@@ -24,6 +24,7 @@ else:
 # Setup the RockyBorg
 global RB
 RB = RockyBorg.RockyBorg()      # Create a new RockyBorg object
+#RB.timeout = 0.1               # Uncomment to give up on commands after 0.1 seconds instead of freezing the GUI
 #RB.i2cAddress = 0x52           # Uncomment and change the value if you have changed the board address
 RB.Init()                       # Set the board up (checks the board is connected)
 RB.SetMotorsEnabled(True)       # Enable motor power
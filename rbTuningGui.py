@@ -16,7 +16,9 @@ else:
 # Start the RockyBorg
 global RB
 RB = RockyBorg.RockyBorg()      # Create a new RockyBorg object
+#RB.timeout = 0.1               # Uncomment to give up on commands after 0.1 seconds instead of freezing the GUI
 RB.Init()                       # Set the board up (checks the board is connected)
+RB.StartTelemetry()             # Read the board state in the background
 
 # Calibration settings
 CAL_PWM_MIN = 0                 # Minimum selectable calibration burst (1000 = 1 ms)
@@ -155,9 +157,16 @@ class RockyBorgTuning_tk(Tkinter.Tk):
     def poll(self):
         global RB
 
-        # Read the servo position
-        servo = RB.GetRawServoPosition()
-        self.lblServo['text'] = '%d' % (servo)
+        # Show the servo position from the latest telemetry
+        snapshot = RB.GetTelemetry()
+        if snapshot is None:
+            servo = None
+        else:
+            servo = snapshot.servoRaw
+        if servo is None:
+            self.lblServo['text'] = '-'
+        else:
+            self.lblServo['text'] = '%d' % (servo)
 
         # Prime the next poll
         self.after(200, self.poll)
@@ -189,6 +198,7 @@ class RockyBorgTuning_tk(Tkinter.Tk):
     # Called when the user closes the dialog
     def OnExit(self):
         # End the program
+        RB.StopTelemetry()
         self.quit()
 
     # Called when sld is moved
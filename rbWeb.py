@@ -15,13 +15,32 @@ import sys
 import threading
 import picamera
 import picamera.array
+import numpy
 import cv2
 import datetime
 import textwrap
+import socket
+import select
+import struct
+import hashlib
+import json
+import math
+import re
+import zlib
+import base64
+import os
+import collections
+import bisect
+import fcntl
+import termios
 try:
     import socketserver
 except ImportError:
     import SocketServer as socketserver
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 # Settings for the web-page
 webPort = 80                            # Port number for the web-page, 80 is what web-pages normally use
@@ -29,24 +48,56 @@ imageWidth = 240                        # Width of the captured image in pixels
 imageHeight = 192                       # Height of the captured image in pixels
 frameRate = 10                          # Number of images to capture per second
 displayRate = 10                        # Number of images to request per second
+mjpegStream = True                      # True to stream the camera on one connection, False to request each image separately
+gzipPages = True                        # True to send pages compressed to browsers which accept it
 photoDirectory = '/home/pi'             # Directory to save photos to
+photoQueueLimit = 200                   # Most photos waiting to be written, more are dropped
+photoBatch = 10                         # Most photos written before waiting for the SD card to store them
+burstLimit = 100                        # Most photos taken by a single burst
+dashcamDirectory = None                 # Directory to keep recording the camera to, e.g. '/home/pi/dashcam', None to not record
+dashcamDiskLimit = 1024 * 1024 * 1024   # Most disk space used by the recording in bytes, the oldest frames are overwritten
+dashcamSegmentSize = 16 * 1024 * 1024   # Largest size of each part of the recording in bytes, the disk limit is split into these
+dashcamVariant = 1                      # Entry in streamVariants to record, smaller variants keep more minutes
+dashcamFlushTime = 2.0                  # Time in seconds frames are gathered for before they are written together
+dashcamQueueLimit = 50                  # Most recorded frames waiting to be written, more are dropped
 flippedCamera = False                   # Swap between True and False if the camera image is rotated by 180
+maxImageSenders = 4                     # Most images or streams sent at once, more viewers are turned away
+keepAliveTimeout = 10.0                 # Time in seconds an idle connection is kept open for more requests
+maxRequestSize = 8192                   # Largest request accepted in bytes, larger requests are refused
+driveRate = 20                          # Most drive updates sent to the RockyBorg per second, newer requests replace waiting ones
+statusInterval = 1.0                    # Time in seconds between status updates sent to an idle WebSocket
+driveLatencyBound = 0.05                # Time in seconds a drive command should be answered within
+metricBuckets = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0]  # Histogram bucket limits in seconds for /metrics
+frameBuffers = 4                        # Number of camera frames kept in memory, reused in turn, more than encoderThreads
+encoderThreads = 2                      # Number of threads encoding camera frames at once, up to one per CPU core
+captureIdleTime = 2.0                   # Time in seconds without any viewers before the camera frames are ignored
 jpegQuality = 80                        # JPEG quality level, smaller is faster, higher looks better (0 to 100)
+streamVariants = [(1.0, jpegQuality), (1.0, 50), (0.5, 50), (0.5, 30)]  # (size, JPEG quality) for streams, best first
 watchdogTimeout = 1.5                   # Time in seconds before we decide we have lost contact
 maximumWidth = 1000                     # Maximum pixel width for the web page
+i2cTimeout = None                       # Time in seconds before a RockyBorg command is given up on, None to wait forever
+realTime = False                        # True to give the thread driving the motors real-time priority (needs sudo)
+publishState = False                    # True to share the RockyBorg state with other programs, see rbMonitor.py
 
 # Global values
 global RB
-global lastFrame
-global lockFrame
+global frameCache
 global camera
-global processor
 global running
 global watchdog
+global actuator
+global photoWriter
+global dashcamWriter
+global imageSenders
+global burstRunning
+global driveLatency
+global frameTimes
+global driveTimes
 running = True
 
 # Set up the RockyBorg
 RB = RockyBorg.RockyBorg()
+RB.timeout = i2cTimeout
 #RB.i2cAddress = 0x21                   # Uncomment and change the value if you have changed the board address
 RB.Init()
 if not RB.foundChip:
@@ -68,6 +119,11 @@ RB.SetServoPosition(0)
 RB.SetMotorsEnabled(True)
 RB.SetLed(False)
 
+# Read the board state in the background, everything else uses RB.GetTelemetry()
+RB.StartTelemetry()
+if publishState:
+    RB.StartSharedState()
+
 # Power settings
 voltageIn = 1.2 * 8                     # Total battery voltage to the RockyBorg
 voltageOut = 6.0                        # Maximum motor voltage
@@ -84,129 +140,1101 @@ class Watchdog(threading.Thread):
         super(Watchdog, self).__init__()
         self.event = threading.Event()
         self.terminated = False
+        self.timedOut = True
+        self.timeouts = 0
+        self.lastContact = None
         self.start()
         self.timestamp = time.time()
 
     def run(self):
-        timedOut = True
         # This method runs in a separate thread
+        # Blink the LED while waiting for a connection
+        RB.SetLedPattern('blink')
         while not self.terminated:
-            if timedOut:
+            if self.timedOut:
                 # Wait for a network event to be flagged for up to one second
                 if self.event.wait(1):
                     # Connection
                     print('Reconnected...')
-                    RB.SetLed(True)
-                    timedOut = False
+                    RB.SetLedPattern('solid')
+                    self.timedOut = False
+                    self.lastContact = time.time()
                     self.event.clear()
-                else:
-                    # Waiting for a connection
-                    RB.SetLed(not RB.GetLed())
             else:
                 # Wait for a network event to be flagged for up to the timeout time
                 if self.event.wait(watchdogTimeout):
                     # Still connected
+                    self.lastContact = time.time()
                     self.event.clear()
-                    RB.SetLed(True)
                 else:
                     # Timed out
                     print('Timed out...')
-                    RB.SetLed(False)
-                    timedOut = True
-                    RB.MotorsOff()
+                    RB.SetLedPattern('blink')
+                    self.timedOut = True
+                    self.timeouts += 1
+                    actuator.Stop()
+
+    def Statistics(self):
+        return {'connected': not self.timedOut, 'lastContact': self.lastContact, 'timeouts': self.timeouts}
 
-# Image stream processing thread
-class StreamProcessor(threading.Thread):
+# Drive thread, applies the latest drive request no faster than driveRate
+class DriveActuator(threading.Thread):
     def __init__(self):
-        super(StreamProcessor, self).__init__()
-        self.stream = picamera.array.PiRGBArray(camera)
+        super(DriveActuator, self).__init__()
+        self.lock = threading.Lock()
         self.event = threading.Event()
+        self.stopEvent = threading.Event()
+        self.pending = None
+        self.pendingTime = None
+        self.requested = None                       # Latest speed and steering asked for, None once stopped
+        self.applied = None
+        self.lastUpdate = 0.0
+        self.requests = 0
+        self.updates = 0
         self.terminated = False
         self.start()
-        self.begin = 0
 
     def run(self):
-        global lastFrame
-        global lockFrame
-        # This method runs in a separate thread
+        # This method runs in a separate thread, only this thread gets real-time priority
+        # Threads started later, such as the request handlers, keep normal scheduling
+        # Memory is not locked, every connection starts a thread and locking their stacks could use up the RAM
+        if realTime:
+            report = RockyBorg.EnableRealTime(lockMemory = False)
+            for message in report.messages:
+                print(message)
         while not self.terminated:
-            # Wait for an image to be written to the stream
-            if self.event.wait(1):
+            if not self.event.wait(1):
+                continue
+            # Wait out the rest of the update interval, a stop does not wait
+            delay = (self.lastUpdate + 1.0 / driveRate) - time.time()
+            if delay > 0:
+                self.stopEvent.wait(delay)
+            with self.lock:
+                command = self.pending
+                receiptTime = self.pendingTime
+                self.pending = None
+                self.event.clear()
+                self.stopEvent.clear()
+            if (command is None) or self.terminated:
+                continue
+            if command == 'stop':
+                RB.MotorsOff()
+                self.applied = None
+            elif command != self.applied:
+                writeTime = time.time()
                 try:
-                    # Read the image and save globally
-                    self.stream.seek(0)
-                    if flippedCamera:
-                        # Rotate counter-clockwise
-                        rotatedArray = cv2.transpose(self.stream.array) # Swap X and Y
-                        rotatedArray = cv2.flip(rotatedArray, 1)        # Flip image in X
+                    errors = Drive(*command)
+                except Exception as e:
+                    # Never leave the motors running on an older command, and keep this thread going
+                    RB.PrintLevel(RockyBorg.PRINT_ERROR, 'Failed to drive at speed %s steering %s: %s', command[0], command[1], e)
+                    RB.MotorsOff()
+                    errors = [e]
+                appliedTime = time.time()
+                driveTimes.Observe('write', appliedTime - writeTime)
+                if any(error is not None for error in errors):
+                    # Try again next time even if the request is the same
+                    self.applied = None
+                else:
+                    self.applied = command
+                    driveTimes.Observe('apply', appliedTime - receiptTime)
+            else:
+                # Same as the last update, nothing to send
+                continue
+            self.updates += 1
+            self.lastUpdate = time.time()
+
+    def Request(self, speed, steering, receiptTime):
+        # Replaces any waiting request, returns straight away
+        with self.lock:
+            self.pending = (speed, steering)
+            self.pendingTime = receiptTime
+            self.requested = self.pending
+            self.requests += 1
+        self.event.set()
+
+    def Stop(self):
+        # Turns the motors off as soon as possible
+        with self.lock:
+            self.pending = 'stop'
+            self.requested = None
+        self.stopEvent.set()
+        self.event.set()
+
+    def Report(self):
+        return 'Sent %d drive updates for %d drive requests' % (self.updates, self.requests)
+
+    def Statistics(self):
+        applied = self.applied
+        if applied is None:
+            speed, steering = 0.0, 0.0
+        else:
+            speed, steering = applied
+        return {'speed': speed, 'steering': steering, 'requested': self.requested, 'lastUpdate': self.lastUpdate,
+                'requests': self.requests, 'updates': self.updates}
+
+# One preallocated camera frame, written directly by picamera
+class FrameBuffer:
+    def __init__(self, rawResolution):
+        # picamera pads the frame width and height, see picamera.array.raw_resolution
+        # Video port frames go through the splitter and are only padded to a multiple of 16, not 32
+        rawWidth, rawHeight = rawResolution
+        self.array = numpy.empty((rawHeight, rawWidth, 3), dtype = numpy.uint8)
+        self.image = self.array[:imageHeight, :imageWidth]  # View of the picture without the padding
+        self.data = memoryview(self.array.reshape(-1))
+        self.size = 0
+        self.sequence = None                                # None while the frame is being written
+        self.lock = threading.Lock()
+
+    def write(self, data):
+        # Called by picamera with each part of the frame
+        length = min(len(data), len(self.data) - self.size)
+        self.data[self.size : self.size + length] = data[:length]
+        self.size += length
+        return len(data)
+
+    def Reuse(self):
+        # Marks the frame as being overwritten, waits for anyone still reading it
+        with self.lock:
+            self.sequence = None
+            self.size = 0
+
+# Latest encoded camera frames, shared by every viewer
+# Frames are only encoded while someone is watching, and only in the streamVariants someone has asked for recently
+# Each variant is encoded at most once per frame, variant 0 is used for snapshots and photos
+class FrameCache:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.demandEvent = threading.Event()
+        self.lastDemand = 0.0
+        self.variantDemand = [0.0] * len(streamVariants)
+        self.encodeQueue = queue.Queue()            # Only ever holds frames for encoders which are waiting
+        self.idleEncoders = 0
+        self.sequence = 0
+        self.pending = collections.deque()          # Sequence numbers given to the encoders, oldest first
+        self.results = {}                           # Encoded frames waiting for an older frame to finish
+        self.jpegs = [None] * len(streamVariants)
+        self.jpegSequences = [0] * len(streamVariants)
+        self.jpegTimes = [0.0] * len(streamVariants)
+        self.jpegSizes = [0.0] * len(streamVariants)   # Recent average size of each variant in bytes
+        self.captured = 0
+        self.encoded = 0
+        self.dropped = 0
+        self.latencyTotal = 0.0
+        self.latencyWorst = 0.0
+
+    def Demand(self, variant):
+        # Records that a viewer wants a variant, returns True if it was not already being encoded
+        now = time.time()
+        idle = (now - self.variantDemand[variant]) >= captureIdleTime
+        self.lastDemand = now
+        self.variantDemand[variant] = now
+        self.demandEvent.set()
+        return idle
+
+    def Wanted(self):
+        # True while someone has asked for a frame recently
+        return (time.time() - self.lastDemand) < captureIdleTime
+
+    def WantedVariants(self):
+        now = time.time()
+        return [variant for variant in range(len(streamVariants)) if (now - self.variantDemand[variant]) < captureIdleTime]
+
+    def Store(self, frame):
+        # Called once picamera has finished writing a frame, hands it to a free encoder without copying it
+        with self.condition:
+            self.sequence += 1
+            self.captured += 1
+            sequence = self.sequence
+            with frame.lock:
+                frame.sequence = sequence
+            if self.idleEncoders > 0:
+                self.idleEncoders -= 1
+                self.encodeQueue.put_nowait((frame, sequence, time.time()))
+                self.pending.append(sequence)
+            else:
+                # Every encoder is busy, skip this frame rather than fall behind
+                self.dropped += 1
+
+    def EncoderReady(self):
+        # Called by an encoder before it waits for the next frame
+        with self.condition:
+            self.idleEncoders += 1
+
+    def Publish(self, sequence, jpegs, captureTime):
+        # Called by an encoder, frames are made available in the order they were captured
+        with self.condition:
+            self.results[sequence] = (jpegs, captureTime)
+            while self.pending and (self.pending[0] in self.results):
+                oldest = self.pending.popleft()
+                encoded, captured = self.results.pop(oldest)
+                if not encoded:
+                    # Overwritten before it could be encoded
+                    self.dropped += 1
+                    continue
+                for variant, jpeg in encoded.items():
+                    self.jpegs[variant] = jpeg
+                    self.jpegSequences[variant] = oldest
+                    self.jpegTimes[variant] = captured
+                    if self.jpegSizes[variant] == 0.0:
+                        self.jpegSizes[variant] = float(len(jpeg))
                     else:
-                        # Rotate clockwise
-                        rotatedArray = cv2.flip(self.stream.array, 1)   # Flip image in X
-                        rotatedArray = cv2.transpose(rotatedArray)      # Swap X and Y
-                    retval, thisFrame = cv2.imencode('.jpg', rotatedArray, [cv2.IMWRITE_JPEG_QUALITY, jpegQuality])
-                    del rotatedArray
-                    lockFrame.acquire()
-                    lastFrame = thisFrame
-                    lockFrame.release()
-                finally:
-                    # Reset the stream and event
-                    self.stream.seek(0)
-                    self.stream.truncate()
-                    self.event.clear()
+                        self.jpegSizes[variant] += 0.2 * (len(jpeg) - self.jpegSizes[variant])
+                latency = time.time() - captured
+                frameTimes.Observe('publish', latency)
+                self.encoded += 1
+                self.latencyTotal += latency
+                self.latencyWorst = max(self.latencyWorst, latency)
+            self.condition.notify_all()
+
+    def WaitForFrame(self, variant, lastSequence, timeout):
+        # Waits for a frame of this variant newer than lastSequence, returns the newest sequence number
+        self.Demand(variant)
+        endTime = time.time() + timeout
+        with self.condition:
+            while (self.jpegSequences[variant] <= lastSequence) and (time.time() < endTime):
+                self.condition.wait(endTime - time.time())
+            return self.jpegSequences[variant]
+
+    def GetJpeg(self, variant = 0):
+        # Returns the newest frame as a JPEG with its sequence number and capture time, or None if there is no frame
+        idle = self.Demand(variant)
+        with self.condition:
+            if idle:
+                # Nothing was encoding this variant, wait for a fresh frame
+                lastSequence = self.jpegSequences[variant]
+                endTime = time.time() + 1.0
+                while (self.jpegSequences[variant] == lastSequence) and (time.time() < endTime):
+                    self.condition.wait(endTime - time.time())
+            return self.jpegs[variant], self.jpegSequences[variant], self.jpegTimes[variant]
+
+    def ExpectedSize(self, variant):
+        # Average JPEG size for a variant, estimated from the others if it has not been encoded yet
+        if self.jpegSizes[variant] > 0.0:
+            return self.jpegSizes[variant]
+        for known in range(len(streamVariants)):
+            if self.jpegSizes[known] > 0.0:
+                ratio = (streamVariants[variant][0] / streamVariants[known][0]) ** 2
+                return self.jpegSizes[known] * ratio
+        return 0.0
+
+    def Report(self):
+        with self.condition:
+            if self.encoded:
+                averageLatency = self.latencyTotal / self.encoded
+            else:
+                averageLatency = 0.0
+            return ('Camera frames: %d captured, %d encoded, %d dropped, latency average %.1f ms, worst %.1f ms' % (
+                    self.captured, self.encoded, self.dropped, averageLatency * 1000, self.latencyWorst * 1000))
+
+    def Statistics(self):
+        with self.condition:
+            if self.encoded:
+                averageLatency = self.latencyTotal / self.encoded
+            else:
+                averageLatency = 0.0
+            return {'sequence': self.sequence, 'captured': self.captured, 'encoded': self.encoded,
+                    'dropped': self.dropped, 'latencyAverage': averageLatency, 'latencyWorst': self.latencyWorst,
+                    'variants': self.WantedVariants(), 'jpegSizes': list(self.jpegSizes)}
+
+# Frame encoding thread, several run at once to use all of the CPU cores
+class FrameEncoder(threading.Thread):
+    def __init__(self):
+        super(FrameEncoder, self).__init__()
+        self.rotated = numpy.empty((imageWidth, imageHeight, 3), dtype = numpy.uint8)
+        self.scaled = []
+        for scale, quality in streamVariants:
+            if scale < 1.0:
+                self.scaled.append(numpy.empty((int(imageWidth * scale), int(imageHeight * scale), 3), dtype = numpy.uint8))
+            else:
+                self.scaled.append(None)
+        self.daemon = True
+        self.terminated = False
+        self.start()
+
+    def run(self):
+        # This method runs in a separate thread, frames are only handed over while it is waiting for one
+        while not self.terminated:
+            frameCache.EncoderReady()
+            work = None
+            while (work is None) and not self.terminated:
+                try:
+                    work = frameCache.encodeQueue.get(True, 1)
+                except queue.Empty:
+                    pass
+            if work is None:
+                break
+            frame, sequence, captureTime = work
+            frameTimes.Observe('wait', time.time() - captureTime)
+            try:
+                jpegs = self.Encode(frame, sequence)
+            except Exception as e:
+                # Skip the frame, it still has to be published so the frames after it are not held up
+                RB.PrintLevel(RockyBorg.PRINT_ERROR, 'Failed to encode a camera frame: %s', e)
+                jpegs = {}
+            frameCache.Publish(sequence, jpegs, captureTime)
+
+    def Encode(self, frame, sequence):
+        # Rotates into the reused array then encodes each wanted variant, returns {} if the frame was overwritten first
+        with frame.lock:
+            if frame.sequence != sequence:
+                return {}
+            rotateTime = time.time()
+            if flippedCamera:
+                cv2.rotate(frame.image, cv2.ROTATE_90_CLOCKWISE, self.rotated)
+            else:
+                cv2.rotate(frame.image, cv2.ROTATE_90_COUNTERCLOCKWISE, self.rotated)
+        encodeTime = time.time()
+        frameTimes.Observe('rotate', encodeTime - rotateTime)
+        jpegs = {}
+        for variant in frameCache.WantedVariants():
+            scale, quality = streamVariants[variant]
+            image = self.scaled[variant]
+            if image is None:
+                image = self.rotated
+            else:
+                cv2.resize(self.rotated, (image.shape[1], image.shape[0]), image, interpolation = cv2.INTER_AREA)
+            retval, jpegs[variant] = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        frameTimes.Observe('encode', time.time() - encodeTime)
+        return jpegs
 
 # Image capture thread
 class ImageCapture(threading.Thread):
     def __init__(self):
         super(ImageCapture, self).__init__()
+        rawResolution = picamera.array.raw_resolution(camera.resolution, splitter = True)
+        self.frames = [FrameBuffer(rawResolution) for i in range(frameBuffers)]
         self.start()
 
     def run(self):
         global camera
-        global processor
         print('Start the stream using the video port')
         camera.capture_sequence(self.TriggerStream(), format='bgr', use_video_port=True)
-        print('Terminating camera processing...')
-        processor.terminated = True
-        processor.join()
-        print('Processing terminated.')
+        print('Camera processing terminated.')
 
-    # Stream delegation loop
+    # Stream delegation loop, picamera writes each frame into the next buffer in the ring
     def TriggerStream(self):
         global running
+        index = 0
+        while running:
+            if not frameCache.Wanted():
+                # Nobody is watching, leave the camera frames alone until someone asks for one
+                frameCache.demandEvent.clear()
+                if not frameCache.Wanted():
+                    frameCache.demandEvent.wait(1)
+            else:
+                frame = self.frames[index]
+                index = (index + 1) % frameBuffers
+                frame.Reuse()
+                handedOver = time.time()
+                yield frame
+                # The frame has been written, keep it for the viewers
+                frameTimes.Observe('capture', time.time() - handedOver)
+                if frame.size != len(frame.data):
+                    # The padding does not match what picamera wrote, the picture would come out sheared
+                    RB.PrintLevel(RockyBorg.PRINT_WARNING, 'Camera frame was %d bytes instead of %d, check the frame padding',
+                                  frame.size, len(frame.data))
+                frameCache.Store(frame)
+
+# Photo writing thread, files are written in batches and flushed to the SD card together
+class PhotoWriter(threading.Thread):
+    def __init__(self):
+        super(PhotoWriter, self).__init__()
+        self.photos = queue.Queue(photoQueueLimit)
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.terminated = False
+        self.start()
+
+    def run(self):
+        # This method runs in a separate thread, it empties the queue before ending
+        while not (self.terminated and self.photos.empty()):
+            try:
+                batch = [self.photos.get(True, 1)]
+            except queue.Empty:
+                continue
+            while len(batch) < photoBatch:
+                try:
+                    batch.append(self.photos.get_nowait())
+                except queue.Empty:
+                    break
+            self.WriteBatch(batch)
+
+    def WriteBatch(self, batch):
+        # Write every file, then wait for all of them to be stored
+        photoFiles = []
+        for photoName, jpeg in batch:
+            photoFile = None
+            try:
+                photoFile = open(photoName, 'wb')
+                photoFile.write(FrameView(jpeg))
+                photoFiles.append(photoFile)
+            except (IOError, OSError) as e:
+                print('Failed to save %s: %s' % (photoName, e))
+                self.failed += 1
+                if photoFile is not None:
+                    try:
+                        photoFile.close()
+                    except (IOError, OSError):
+                        pass
+        for photoFile in photoFiles:
+            try:
+                photoFile.flush()
+                os.fsync(photoFile.fileno())
+                photoFile.close()
+                self.written += 1
+            except (IOError, OSError) as e:
+                print('Failed to save %s: %s' % (photoFile.name, e))
+                self.failed += 1
+        try:
+            # Store the new directory entries as well
+            directory = os.open(photoDirectory, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        except OSError:
+            pass
+
+    def Save(self, photoName, jpeg):
+        # Queues a photo to be written, returns False if the queue is full
+        try:
+            self.photos.put_nowait((photoName, jpeg))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def Depth(self):
+        return self.photos.qsize()
+
+    def Report(self):
+        return 'Photos: %d saved, %d failed, %d dropped' % (self.written, self.failed, self.dropped)
+
+    def Statistics(self):
+        return {'waiting': self.Depth(), 'saved': self.written, 'failed': self.failed, 'dropped': self.dropped}
+
+# Burst thread, saves the next frames from the camera for a number of frames or a length of time
+# The caller must hold burstRunning, it is released when the burst ends
+class PhotoBurst(threading.Thread):
+    def __init__(self, count, duration):
+        super(PhotoBurst, self).__init__()
+        self.count = count
+        self.duration = duration
+        self.daemon = True
+        self.start()
+
+    def run(self):
+        # This method runs in a separate thread
+        try:
+            burstName = '%s/Burst %s' % (photoDirectory, datetime.datetime.utcnow())
+            endTime = time.time() + self.duration
+            lastSequence = frameCache.jpegSequences[0]
+            taken = 0
+            while running and (taken < self.count) and (time.time() < endTime):
+                if frameCache.WaitForFrame(0, lastSequence, 1) <= lastSequence:
+                    continue
+                jpeg, lastSequence, captureTime = frameCache.GetJpeg()
+                if not photoWriter.Save('%s %03d.jpg' % (burstName, taken + 1), jpeg):
+                    break
+                taken += 1
+        finally:
+            burstRunning.release()
+
+# Dashcam thread, passes every new frame to the dashcam writer along with the drive command in use
+class DashcamRecorder(threading.Thread):
+    def __init__(self):
+        super(DashcamRecorder, self).__init__()
+        self.start()
+
+    def run(self):
+        # This method runs in a separate thread, asking for frames keeps the camera running
+        lastSequence = 0
         while running:
-            if processor.event.is_set():
-                time.sleep(0.01)
+            if frameCache.WaitForFrame(dashcamVariant, lastSequence, 1) <= lastSequence:
+                continue
+            jpeg, lastSequence, captureTime = frameCache.GetJpeg(dashcamVariant)
+            command = actuator.applied
+            if command is None:
+                speed, steering = 0.0, 0.0
             else:
-                yield processor.stream
-                processor.event.set()
+                speed, steering = command
+            dashcamWriter.Save(captureTime, jpeg, speed, steering)
+
+# Dashcam writing thread, keeps the recording in a ring of segment files which are reused oldest first
+# Each segment is a pair of files:
+#   segment-NNN.mjpeg   the JPEG frames one after another
+#   segment-NNN.index   one indexRecord per frame, in time order
+# A segment and its index together never grow past dashcamSegmentSize
+# The ring always has at least two segments, smaller ones are used if dashcamDiskLimit cannot hold two full size
+class DashcamWriter(threading.Thread):
+    indexRecord = struct.Struct('<dIIff')   # Capture time, offset and length in the .mjpeg file, speed, steering
+
+    def __init__(self):
+        super(DashcamWriter, self).__init__()
+        self.frames = queue.Queue(dashcamQueueLimit)
+        self.segmentSize = min(dashcamSegmentSize, dashcamDiskLimit // 2)
+        self.segmentCount = dashcamDiskLimit // self.segmentSize
+        self.segment = None
+        self.dataFile = None
+        self.indexFile = None
+        self.dataSize = 0
+        self.indexSize = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.terminated = False
+        if not os.path.isdir(dashcamDirectory):
+            os.makedirs(dashcamDirectory)
+        self.RemoveOldSegments()
+        # Carry on after the newest segment from an earlier run so it is kept for as long as possible
+        newest = None
+        for segment in range(self.segmentCount):
+            try:
+                modified = os.path.getmtime(self.SegmentName(segment, 'index'))
+            except OSError:
+                continue
+            if (newest is None) or (modified > newest):
+                newest = modified
+                self.segment = segment
+        self.start()
+
+    def SegmentName(self, segment, extension):
+        return '%s/segment-%03d.%s' % (dashcamDirectory, segment, extension)
+
+    def RemoveOldSegments(self):
+        # An earlier run with a larger disk limit or segment size may have left more or bigger segments than now fit
+        sizes = {}
+        for fileName in os.listdir(dashcamDirectory):
+            match = re.match(r'segment-(\d+)\.(mjpeg|index)$', fileName)
+            if match:
+                segment = int(match.group(1))
+                sizes[segment] = sizes.get(segment, 0) + os.path.getsize(os.path.join(dashcamDirectory, fileName))
+        for segment, size in sizes.items():
+            if (segment >= self.segmentCount) or (size > self.segmentSize):
+                for extension in ('index', 'mjpeg'):
+                    try:
+                        os.remove(self.SegmentName(segment, extension))
+                    except OSError:
+                        pass
+
+    def run(self):
+        # This method runs in a separate thread, it empties the queue before ending
+        while not (self.terminated and self.frames.empty()):
+            try:
+                batch = [self.frames.get(True, 1)]
+            except queue.Empty:
+                continue
+            # Gather frames for a while so the SD card sees a few large writes instead of many small ones
+            flushTime = time.time() + dashcamFlushTime
+            while not self.terminated:
+                delay = flushTime - time.time()
+                if delay <= 0:
+                    break
+                try:
+                    batch.append(self.frames.get(True, delay))
+                except queue.Empty:
+                    break
+            while True:
+                try:
+                    batch.append(self.frames.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.WriteBatch(batch)
+            except (IOError, OSError) as e:
+                print('Failed to record to %s: %s' % (dashcamDirectory, e))
+                self.failed += len(batch)
+                self.CloseSegment()
+        self.CloseSegment()
+
+    def WriteBatch(self, batch):
+        # Writes the frames to the current segment with one write for the frames and one for the index
+        frames = []
+        records = []
+        for captureTime, jpeg, speed, steering in batch:
+            length = len(jpeg)
+            if (length + self.indexRecord.size) > self.segmentSize:
+                self.dropped += 1
+                continue
+            segmentSize = self.dataSize + length + self.indexSize + self.indexRecord.size
+            if (self.dataFile is None) or (segmentSize > self.segmentSize):
+                self.WriteOut(frames, records)
+                frames = []
+                records = []
+                self.NextSegment()
+            frames.append(FrameView(jpeg))
+            records.append(self.indexRecord.pack(captureTime, self.dataSize, length, speed, steering))
+            self.dataSize += length
+            self.indexSize += self.indexRecord.size
+        self.WriteOut(frames, records)
+
+    def WriteOut(self, frames, records):
+        if not frames:
+            return
+        self.dataFile.write(b''.join(frames))
+        self.dataFile.flush()
+        # The index is only written once the frames it points to are on the SD card
+        os.fsync(self.dataFile.fileno())
+        self.indexFile.write(b''.join(records))
+        self.indexFile.flush()
+        os.fsync(self.indexFile.fileno())
+        self.written += len(frames)
+
+    def NextSegment(self):
+        # Moves on to the next segment in the ring, overwriting the oldest frames
+        self.CloseSegment()
+        if self.segment is None:
+            self.segment = 0
+        else:
+            self.segment = (self.segment + 1) % self.segmentCount
+        # Empty the index first, so a reader never sees entries for frames which have been overwritten
+        self.indexFile = open(self.SegmentName(self.segment, 'index'), 'wb')
+        self.dataFile = open(self.SegmentName(self.segment, 'mjpeg'), 'wb')
+        self.dataSize = 0
+        self.indexSize = 0
+
+    def CloseSegment(self):
+        for segmentFile in (self.dataFile, self.indexFile):
+            if segmentFile is not None:
+                try:
+                    segmentFile.close()
+                except (IOError, OSError):
+                    pass
+        self.dataFile = None
+        self.indexFile = None
+
+    def Save(self, captureTime, jpeg, speed, steering):
+        # Queues a frame to be recorded, it is dropped if the writer has fallen behind
+        try:
+            self.frames.put_nowait((captureTime, jpeg, speed, steering))
+        except queue.Full:
+            self.dropped += 1
+
+    def Report(self):
+        return 'Dashcam: %d frames recorded, %d failed, %d dropped' % (self.written, self.failed, self.dropped)
+
+    def Statistics(self):
+        return {'segment': self.segment, 'segments': self.segmentCount, 'segmentSize': self.segmentSize,
+                'waiting': self.frames.qsize(),
+                'recorded': self.written, 'failed': self.failed, 'dropped': self.dropped}
+
+# Number of bytes sent on a socket which the other end has not received yet, None if it cannot be checked
+def UnsentBytes(connection):
+    try:
+        queued = fcntl.ioctl(connection.fileno(), termios.TIOCOUTQ, struct.pack('i', 0))
+        return struct.unpack('i', queued)[0]
+    except (IOError, OSError):
+        return None
+
+# Picks the stream variant for one viewer from how fast it actually receives data
+class StreamRate:
+    def __init__(self, connection):
+        self.connection = connection
+        self.variant = 0
+        self.throughput = None                              # Estimated bytes per second the viewer can receive
+        self.lastQueued = 0
+        self.lastTime = time.time()
+        self.cleanFrames = 0
+        self.sent = 0
+        self.dropped = 0
+
+    def Check(self):
+        # Returns True if the next frame should be sent, False to drop it because the last one is still queued
+        queued = UnsentBytes(self.connection)
+        if queued is None:
+            return True
+        now = time.time()
+        elapsed = now - self.lastTime
+        if elapsed > 0:
+            rate = (self.lastQueued - queued) / elapsed
+            if queued > 0:
+                # Data was waiting the whole time, so this is how fast the viewer really is
+                if self.throughput is None:
+                    self.throughput = rate
+                else:
+                    self.throughput += 0.3 * (rate - self.throughput)
+            elif (rate > 0) and ((self.throughput is None) or (rate > self.throughput)):
+                # Everything was received, the viewer is at least this fast
+                self.throughput = rate
+        self.lastQueued = queued
+        self.lastTime = now
+        expected = frameCache.ExpectedSize(self.variant)
+        if queued > expected / 2:
+            # Still sending the last frame, drop this one and use a smaller variant
+            self.dropped += 1
+            self.cleanFrames = 0
+            self.ChooseVariant()
+            return False
+        self.cleanFrames += 1
+        if (self.cleanFrames > 2 * displayRate) and (self.variant > 0):
+            # Keeping up for a while, try the next better variant
+            self.variant -= 1
+            self.cleanFrames = 0
+        return True
+
+    def ChooseVariant(self):
+        # Step down to the best variant which fits in the measured throughput with some room to spare
+        variant = len(streamVariants) - 1
+        if self.throughput is not None:
+            for variant in range(len(streamVariants)):
+                if frameCache.ExpectedSize(variant) * displayRate < 0.8 * self.throughput:
+                    break
+        self.variant = min(max(variant, self.variant + 1), len(streamVariants) - 1)
+
+    def Sent(self, length):
+        # Called after a frame of length bytes has been handed to the socket
+        self.lastQueued += length
+        self.sent += 1
+
+# Flag to hold back a partly sent reply so it shares packets with the rest, where available
+sendMoreFlag = getattr(socket, 'MSG_MORE', 0)
+
+# Gets the JPEG data for a frame without copying it
+def FrameView(frame):
+    if sys.version_info[0] > 2:
+        return memoryview(frame)
+    else:
+        return frame.tostring()
+
+# Works out the motor 1, motor 2 and servo levels for a speed and steering, both -1 to +1
+def MixDrive(speed, steering):
+    # Ensure settings are within limits
+    if speed < -1:
+        speed = -1
+    elif speed > 1:
+        speed = 1
+    if steering < -1:
+        steering = -1
+    elif steering > 1:
+        steering = 1
+    # Determine the motor settings
+    driveLeft = speed
+    driveRight = speed
+    if steering < -0.05:
+        # Turning left
+        driveLeft *= 1.0 + (0.5 * steering)
+    elif steering > 0.05:
+        # Turning right
+        driveRight *= 1.0 - (0.5 * steering)
+    return -driveLeft * maxPower, +driveRight * maxPower, steering
+
+# True for a speed or steering value which can be driven at, NaN and infinity get past the limits in MixDrive
+def Finite(value):
+    return not (math.isnan(value) or math.isinf(value))
+
+# Sets the motors and servo for a speed and steering, both -1 to +1, returns the errors from FlushBatch
+def Drive(speed, steering):
+    motor1, motor2, servoPosition = MixDrive(speed, steering)
+    # Set the outputs, sent together as one I²C transfer
+    RB.StartBatch()
+    try:
+        RB.SetMotor1(motor1)
+        RB.SetMotor2(motor2)
+        RB.SetServoPosition(servoPosition)
+    finally:
+        errors = RB.FlushBatch()
+    return errors
+
+# Gets the servo, left and right levels shown on the page as percentages
+# These are the levels just asked for, the board may not have been set yet, see /status.json for the measured levels
+def StatusValues():
+    powerCorrection = 100.0 / maxPower
+    command = actuator.requested
+    if command is None:
+        # Stopped, or nothing asked for yet, show what was last sent to the board
+        setpoints = RB.setpoints
+        motor1 = setpoints.motor1 or 0.0
+        motor2 = setpoints.motor2 or 0.0
+        servoPosition = setpoints.servoPosition or 0.0
+    else:
+        motor1, motor2, servoPosition = MixDrive(*command)
+    leftMotor = motor2 * powerCorrection
+    rightMotor = motor1 * powerCorrection
+    return servoPosition * 100.0, leftMotor, rightMotor, photoWriter.Depth()
+
+# Gets the status as shown on the page, "servo left right saving"
+def StatusText():
+    return '%.0f %.0f %.0f %d' % StatusValues()
+
+# Gets everything known about the robot as JSON, taken from values already in memory so the I²C bus is not used
+def StatusJson():
+    setpoints = RB.setpoints
+    telemetry = RB.GetTelemetry()
+    if telemetry is not None:
+        telemetry = dict(telemetry._asdict())
+    status = {
+        'time': time.time(),
+        'setpoints': dict(setpoints._asdict()),
+        'telemetry': telemetry,
+        'drive': actuator.Statistics(),
+        'watchdog': watchdog.Statistics(),
+        'camera': frameCache.Statistics(),
+        'photos': photoWriter.Statistics(),
+    }
+    if dashcamWriter is not None:
+        status['dashcam'] = dashcamWriter.Statistics()
+    return json.dumps(status, sort_keys = True)
+
+# Records how long drive commands take from the request arriving to the reply being sent
+class LatencyMonitor:
+    def __init__(self, bound):
+        self.bound = bound
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.overBound = 0
+        self.worst = 0.0
+
+    def Record(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+            if len(self.latencies) > 1000:
+                # Keep the most recent half for the percentiles
+                self.latencies = self.latencies[500:]
+            if latency > self.bound:
+                self.overBound += 1
+            self.worst = max(self.worst, latency)
+
+    def Report(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            if not latencies:
+                return 'No drive commands received'
+            return ('Drive command latency: p50 %.1f ms, p99 %.1f ms, worst %.1f ms, %d over the %.0f ms bound' % (
+                    latencies[len(latencies) // 2] * 1000, latencies[int(0.99 * (len(latencies) - 1))] * 1000,
+                    self.worst * 1000, self.overBound, self.bound * 1000))
+
+# Counts how long each stage of a path takes in fixed buckets, shown at /metrics in the Prometheus text format
+class StageHistogram:
+    def __init__(self, name, description, stages):
+        self.name = name
+        self.description = description
+        self.stages = stages
+        self.lock = threading.Lock()
+        self.counts = dict((stage, [0] * (len(metricBuckets) + 1)) for stage in stages)
+        self.sums = dict((stage, 0.0) for stage in stages)
+
+    def Observe(self, stage, seconds):
+        # Cheap enough to call for every frame and every drive command
+        bucket = bisect.bisect_left(metricBuckets, seconds)
+        with self.lock:
+            self.counts[stage][bucket] += 1
+            self.sums[stage] += seconds
+
+    def Text(self):
+        lines = ['# HELP %s %s' % (self.name, self.description), '# TYPE %s histogram' % (self.name)]
+        with self.lock:
+            for stage in self.stages:
+                # Prometheus buckets count everything up to their limit
+                total = 0
+                for limit, count in zip(metricBuckets + ['+Inf'], self.counts[stage]):
+                    total += count
+                    lines.append('%s_bucket{stage="%s",le="%s"} %d' % (self.name, stage, limit, total))
+                lines.append('%s_sum{stage="%s"} %f' % (self.name, stage, self.sums[stage]))
+                lines.append('%s_count{stage="%s"} %d' % (self.name, stage, total))
+        return '\n'.join(lines) + '\n'
+
+# A page which never changes, the replies are built once and sent as they are
+class CachedPage:
+    def __init__(self, content, contentType = 'text/html'):
+        content = textwrap.dedent(content)
+        if sys.version_info[0] > 2:
+            content = content.encode()
+        # Each encoding gets its own ETag, and Vary tells caches the reply depends on Accept-Encoding
+        digest = hashlib.md5(content).hexdigest()
+        self.etag = '"%s"' % (digest)
+        self.compressedEtag = '"%s-gz"' % (digest)
+        self.headers = ('Content-Type: %s\r\n'
+                        'Cache-Control: no-cache\r\n'
+                        'Vary: Accept-Encoding\r\n' % (contentType))
+        self.plain = content
+        self.compressed = None
+        if gzipPages:
+            compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            compressed = compressor.compress(content) + compressor.flush()
+            if len(compressed) < len(content):
+                self.compressed = compressed
+
+    def Send(self, handler):
+        if self.compressed and ('gzip' in handler.headers.get('accept-encoding', '')):
+            etag = self.compressedEtag
+            content = self.compressed
+            encoding = 'Content-Encoding: gzip\r\n'
+        else:
+            etag = self.etag
+            content = self.plain
+            encoding = ''
+        # Browsers which already have this page in the same encoding only need to be told so
+        knownTags = [tag.strip() for tag in handler.headers.get('if-none-match', '').split(',')]
+        if etag in knownTags:
+            handler.sendReply('304 Not Modified', 'ETag: %s\r\nVary: Accept-Encoding\r\n' % (etag))
+        else:
+            handler.sendReply('200 OK', self.headers + 'ETag: %s\r\n' % (etag) + encoding, content)
+
+# The status page, only rendered again when one of the values shown changes
+class StatusPage:
+    def __init__(self):
+        self.cached = (None, None)
+
+    def Get(self):
+        statusText = StatusText()
+        cachedText, page = self.cached
+        if statusText != cachedText:
+            httpText = '''\
+            <html>
+              <body style="margin:0">
+                <center>
+                  <table width="75%%" border="0">
+                    <tr>
+                      <td width="25%%" align="left">Servo: %s %%</td>
+                      <td width="25%%" align="center">Left: %s %%</td>
+                      <td width="25%%" align="center">Right: %s %%</td>
+                      <td width="25%%" align="right">Saving: %s</td>
+                    </tr>
+                  </table>
+                </center>
+              </body>
+            </html>
+            ''' % tuple(statusText.split(' '))
+            page = textwrap.dedent(httpText)
+            if sys.version_info[0] > 2:
+                page = page.encode()
+            self.cached = (statusText, page)
+        return page
+
+# Reads HTTP requests from a connection, copes with a request split over several reads or several arriving together
+class RequestReader:
+    headerEnd = re.compile(b'\r?\n\r?\n')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.buffer = bytearray()
+
+    def Receive(self, timeout):
+        # Adds the next data from the connection to the buffer, False if it closed or nothing arrived in time
+        readable, writable, errored = select.select([self.connection], [], [], timeout)
+        if not readable:
+            return False
+        data = self.connection.recv(4096)
+        if not data:
+            return False
+        self.buffer.extend(data)
+        return True
+
+    def Read(self, timeout):
+        # Returns the method, path, version and headers of the next request, or None if there is not one
+        # Raises ValueError if the request cannot be understood
+        while True:
+            # Blank lines between requests are allowed
+            while self.buffer[:1] in (b'\r', b'\n'):
+                del self.buffer[:1]
+            match = self.headerEnd.search(self.buffer)
+            if match:
+                break
+            if len(self.buffer) > maxRequestSize:
+                raise ValueError('Request too long')
+            if not self.Receive(timeout):
+                return None
+        lines = self.buffer[:match.start()].decode('latin-1').split('\n')
+        del self.buffer[:match.end()]
+        parts = lines[0].split()
+        if (len(parts) != 3) or not parts[2].startswith('HTTP/'):
+            raise ValueError('Bad request line')
+        method, path, version = parts
+        # Header names are not case sensitive
+        headers = {}
+        for line in lines[1:]:
+            if ':' not in line:
+                raise ValueError('Bad header')
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+        # We have no use for a body, but it has to be read to get to the next request
+        length = int(headers.get('content-length', 0))
+        if (length < 0) or (length > maxRequestSize):
+            raise ValueError('Bad content length')
+        while len(self.buffer) < length:
+            if not self.Receive(timeout):
+                return None
+        del self.buffer[:length]
+        return method, path, version, headers
+
+# Web server which handles each request in its own thread, so image transfers never hold up drive commands
+class ThreadedServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
 
 # Class used to implement the web server
 class WebServer(socketserver.BaseRequestHandler):
+    def setup(self):
+        # Send small replies straight away instead of waiting to fill a packet
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
     def handle(self):
+        # Answer requests on this connection until the browser closes it or a reply has to be the last one
+        reader = RequestReader(self.request)
+        self.keepAlive = True
+        try:
+            while running and self.keepAlive:
+                try:
+                    request = reader.Read(keepAliveTimeout)
+                except ValueError:
+                    self.keepAlive = False
+                    self.sendError('400 Bad Request', 'Bad request')
+                    break
+                if request is None:
+                    break
+                method, getPath, version, self.headers = request
+                # HTTP/1.1 connections stay open unless asked not to, HTTP/1.0 connections only if asked to
+                connection = self.headers.get('connection', '').lower()
+                if version == 'HTTP/1.0':
+                    self.keepAlive = ('keep-alive' in connection)
+                else:
+                    self.keepAlive = ('close' not in connection)
+                self.handleRequest(method, getPath)
+        except socket.error:
+            # Browser has gone
+            pass
+
+    def handleRequest(self, method, getPath):
         global RB
-        global lastFrame
+        global frameCache
         global watchdog
-        # Let the watchdog know we received a request
-        watchdog.event.set()
-        # Get the HTTP request data
-        reqData = self.request.recv(1024)
-        if sys.version_info[0] > 2:
-            reqData = reqData.decode()
-        reqData = reqData.strip().split('\n')
-        # Get the URL requested
-        getPath = ''
-        for line in reqData:
-            if line.startswith('GET'):
-                parts = line.split(' ')
-                getPath = parts[1]
-                break
-        if getPath.startswith('/cam.jpg'):
-            # Camera snapshot
-            lockFrame.acquire()
-            sendFrame = lastFrame
-            lockFrame.release()
-            if sendFrame is not None:
-                self.sendImage(sendFrame)
+        requestTime = time.time()
+        # Let the watchdog know we received a request, dashboards reading the status do not keep the robot driving
+        if getPath not in ('/status.json', '/metrics'):
+            watchdog.event.set()
+        if method != 'GET':
+            self.sendError('405 Method Not Allowed', 'Only GET requests are supported', 'Allow: GET\r\n')
+            return
+        if getPath.startswith('/cam.jpg') or getPath.startswith('/mjpeg'):
+            # Camera images, limited so slow viewers cannot use up the Raspberry Pi
+            if not imageSenders.acquire(False):
+                self.sendBusy()
+                return
+            try:
+                if getPath.startswith('/mjpeg'):
+                    # Camera stream
+                    self.sendStream()
+                else:
+                    # Camera snapshot, browsers asking faster than the frame rate are told they have it already
+                    sendFrame, sequence, captureTime = frameCache.GetJpeg()
+                    if sendFrame is None:
+                        self.sendError('503 Service Unavailable', 'No camera image')
+                    else:
+                        etag = '"%x-%d"' % (startTime, sequence)
+                        if self.headers.get('if-none-match') == etag:
+                            self.sendReply('304 Not Modified', 'ETag: %s\r\n' % (etag))
+                        else:
+                            self.sendImage(sendFrame, etag)
+                            frameTimes.Observe('send', time.time() - captureTime)
+            finally:
+                imageSenders.release()
+        elif getPath.startswith('/ws'):
+            # WebSocket carrying drive commands and status
+            key = self.headers.get('sec-websocket-key')
+            if key is None:
+                self.sendText('WebSocket connection expected')
+            else:
+                self.runWebSocket(key)
         elif getPath.startswith('/set/'):
             # Drive setting: /set/speed/steering
             parts = getPath.split('/')
@@ -223,44 +1251,35 @@ class WebServer(socketserver.BaseRequestHandler):
                 # Bad request
                 speed = 0.0
                 steering = 0.0
-            # Ensure settings are within limits
-            if speed < -1:
-                speed = -1
-            elif speed > 1:
-                speed = 1
-            if steering < -1:
-                steering = -1
-            elif steering > 1:
-                steering = 1
-            # Determine the motor settings
-            driveLeft = speed
-            driveRight = speed
-            if steering < -0.05:
-                # Turning left
-                driveLeft *= 1.0 + (0.5 * steering)
-            elif steering > 0.05:
-                # Turning right
-                driveRight *= 1.0 - (0.5 * steering)
-            # Set the outputs
-            RB.SetMotor1(-driveLeft * maxPower)
-            RB.SetMotor2(+driveRight * maxPower)
-            RB.SetServoPosition(steering)
+            if not (Finite(speed) and Finite(steering)):
+                self.sendError('400 Bad Request', 'Speed and steering must be finite numbers')
+                return
+            actuator.Request(speed, steering, requestTime)
             # Report the current settings
             self.sendStatus()
+            driveLatency.Record(time.time() - requestTime)
+            driveTimes.Observe('ack', time.time() - requestTime)
+        elif getPath == '/status.json':
+            # Current state for scripts and dashboards, cheap enough to ask for often
+            content = StatusJson()
+            if sys.version_info[0] > 2:
+                content = content.encode()
+            self.sendReply('200 OK', 'Content-Type: application/json\r\nCache-Control: no-cache\r\n', content)
+        elif getPath == '/metrics':
+            # Time taken by each stage of the camera and drive paths, for Prometheus
+            content = frameTimes.Text() + driveTimes.Text()
+            if sys.version_info[0] > 2:
+                content = content.encode()
+            self.sendReply('200 OK', 'Content-Type: text/plain; version=0.0.4\r\nCache-Control: no-cache\r\n', content)
         elif getPath.startswith('/photo'):
-            # Save camera photo
-            lockFrame.acquire()
-            captureFrame = lastFrame
-            lockFrame.release()
+            # Save camera photo, written to the SD card in the background
+            captureFrame, sequence, captureTime = frameCache.GetJpeg()
             if captureFrame is not None:
                 photoName = '%s/Photo %s.jpg' % (photoDirectory, datetime.datetime.utcnow())
-                try:
-                    photoFile = open(photoName, 'wb')
-                    photoFile.write(captureFrame)
-                    photoFile.close()
-                    statusText = 'Photo saved to %s' % (photoName)
-                except:
-                    statusText = 'Failed to take photo!'
+                if photoWriter.Save(photoName, captureFrame):
+                    statusText = 'Saving photo to %s' % (photoName)
+                else:
+                    statusText = 'Too many photos waiting to be saved!'
             else:
                 statusText = 'Failed to take photo!'
             httpText = '''\
@@ -273,189 +1292,444 @@ class WebServer(socketserver.BaseRequestHandler):
             </html>
             ''' % (statusText)
             self.sendText(httpText)
-        elif getPath == '/':
-            # Main page, click buttons to move and to stop
-            imageRatio = (100.0 * imageHeight) / imageWidth
+        elif getPath.startswith('/burst/'):
+            # Save a burst of photos: /burst/frames/count or /burst/seconds/time
+            # A burst never takes more than burstLimit photos, or runs for longer than taking them should
+            parts = getPath.split('/')
+            burstTime = burstLimit / float(frameRate)
+            count = None
+            try:
+                if parts[2] == 'frames':
+                    count = int(parts[3])
+                    duration = burstTime
+                    if (count < 1) or (count > burstLimit):
+                        count = None
+                        statusText = 'Burst should be 1 to %d photos' % (burstLimit)
+                    else:
+                        statusText = 'Saving the next %d photos' % (count)
+                elif parts[2] == 'seconds':
+                    duration = float(parts[3])
+                    if not (0.0 < duration <= burstTime):
+                        statusText = 'Burst should be up to %.1f seconds' % (burstTime)
+                    else:
+                        count = burstLimit
+                        statusText = 'Saving photos for %.1f seconds' % (duration)
+                else:
+                    statusText = 'Unknown burst type %s' % (parts[2])
+            except (IndexError, ValueError):
+                statusText = 'Burst should be /burst/frames/count or /burst/seconds/time'
+            if count is not None:
+                if burstRunning.acquire(False):
+                    PhotoBurst(count, duration)
+                else:
+                    statusText = 'A burst is already being saved, try again when it has finished'
             httpText = '''\
             <html>
-              <head>
-                <script language="JavaScript"><!--
-                  function Drive() {
-                    var iframe = document.getElementById("setDrive");
-                    motors = speed.value / 100.0;
-                    turn = steering.value / 100.0;
-                    iframe.src = "/set/" + motors + "/" + turn;
-                  }
-                  function Steering(level) {
-                    steering.value = level;
-                    Drive();
-                  }
-                  function Speed(level) {
-                    speed.value = level;
-                    Drive();
-                  }
-                  function Photo() {
-                    var iframe = document.getElementById("setDrive");
-                    iframe.src = "/photo";
-                  }
-                //--></script>
-                <style>
-                  .slidecontainer { width: 100%%; }
-                  .slider {
-                    -webkit-appearance: none;
-                    width: 100%%;
-                    height: 80px;
-                    border-radius: 25px;
-                    background: #D8D8D8;
-                    outline: none;
-                  }
-                  .slider::-webkit-slider-thumb {
-                    -webkit-appearance: none;
-                    appearance: none;
-                    width: 35px;
-                    height: 80px;
-                    border-radius: 50%%;
-                    background: #000000;
-                  }
-                  .slider::-moz-range-thumb {
-                    width: 35px;
-                    height: 80px;
-                    border-radius: 50%%;
-                    background: #000000;
-                  }
-                </style>
-              </head>
-              <body style="width:100%%; max-width:%ipx;">
-                <div style="position:relative; padding-top:%f%%;">
-                  <iframe src="/stream" style="position:absolute;top:0;left:0;width:100%%;height:100%%;" frameborder="0"></iframe>
-                </div>
-                <iframe id="setDrive" src="/set/0/0" width="100%%" height="30" frameborder="0"></iframe>
+              <body>
                 <center>
-                  <h2>Steering</h2>
-                  <table width="100%%" border="0">
-                    <tr>
-                      <td width="33%%" align="left">left</td>
-                      <td width="33%%" align="center">straight</td>
-                      <td width="33%%" align="right">right</td>
-                    </tr>
-                    <tr>
-                      <td colspan="3">
-                        <input id="steering" type="range" min="-100" max="100" value="0" class="slider" oninput="Drive()" onchange="Drive()"/>
-                      </td>
-                    </tr>
-                  </table>
-                  <table width="100%%" border="0">
-                    <tr>
-                      <td width="20%%"><button onclick="Steering(-100)" style="width:100%%;height:80px;"><b>Hard left</b></button></td>
-                      <td width="20%%"><button onclick="Steering(-50)" style="width:100%%;height:80px;"><b>Left</b></button></td>
-                      <td width="20%%"><button onclick="Steering(0)" style="width:100%%;height:80px;"><b>Straight</b></button></td>
-                      <td width="20%%"><button onclick="Steering(50)" style="width:100%%;height:80px;"><b>Right</b></button></td>
-                      <td width="20%%"><button onclick="Steering(100)" style="width:100%%;height:80px;"><b>Hard right</b></button></td>
-                    </tr>
-                  </table>
-                  <h2>Speed</h2>
-                  <table width="100%%" border="0">
-                    <tr>
-                      <td width="33%%" align="left">reverse</td>
-                      <td width="33%%" align="center">stopped</td>
-                      <td width="33%%" align="right">forward</td>
-                    </tr>
-                    <tr>
-                      <td colspan="3">
-                        <input id="speed" type="range" min="-100" max="100" value="0" class="slider" oninput="Drive()" onchange="Drive()"/>
-                      </td>
-                    </tr>
-                  </table>
-                  <table width="100%%" border="0">
-                    <tr>
-                      <td width="20%%"><button onclick="Speed(-100)" style="width:100%%;height:80px;"><b>Reverse</b></button></td>
-                      <td width="20%%"><button onclick="Speed(-50)" style="width:100%%;height:80px;"><b>Slow reverse</b></button></td>
-                      <td width="20%%"><button onclick="Speed(0)" style="width:100%%;height:80px;"><b>Stop</b></button></td>
-                      <td width="20%%"><button onclick="Speed(50)" style="width:100%%;height:80px;"><b>Slow forward</b></button></td>
-                      <td width="20%%"><button onclick="Speed(100)" style="width:100%%;height:80px;"><b>Forward</b></button></td>
-                    </tr>
-                  </table>
-                  <h2>Tools</h2>
-                  <table width="100%%" border="0">
-                    <tr>
-                      <td width="40%%"></td>
-                      <td width="20%%"><button onclick="Photo()" style="width:100%%;height:80px;"><b>Save Photo</b></button></td>
-                      <td width="40%%"></td>
-                    </tr>
-                  </table>
+                  %s
                 </center>
               </body>
             </html>
-            ''' % (maximumWidth, imageRatio)
+            ''' % (statusText)
             self.sendText(httpText)
+        elif getPath == '/':
+            # Main page, click buttons to move and to stop
+            mainPage.Send(self)
         elif getPath == '/stream':
-            # Streaming frame, set a delayed refresh
-            displayDelay = int(1000 / displayRate)
-            imageRatio = 100.0 * (float(imageHeight ** 2) / float(imageWidth ** 2))
-            httpText = '''\
-            <html>
-              <head>
-                <script language="JavaScript"><!--
-                  function refreshImage() {
-                    if (!document.images) return;
-                    document.images["rpicam"].src = "cam.jpg?" + Math.random();
-                    setTimeout("refreshImage()", %d);
-                  }
-                //--></script>
-              </head>
-              <body style="margin:0" onLoad="setTimeout(\'refreshImage()\', %d)">
-                <center>
-                  <img src="/cam.jpg" style="width:%f%%;" name="rpicam" />
-                </center>
-              </body>
-            </html>
-            ''' % (displayDelay, displayDelay, imageRatio)
-            self.sendText(httpText)
+            # Streaming frame
+            streamPage.Send(self)
         else:
             # Unexpected page
             self.sendText('Path : "%s"' % (getPath))
 
+    def sendReply(self, status, headers, content = None):
+        # Sends a reply, headers are complete lines, content is sent as it is without being copied
+        if content is not None:
+            headers += 'Content-Length: %d\r\n' % (len(content))
+        if self.keepAlive:
+            headers += 'Connection: keep-alive\r\n'
+        else:
+            headers += 'Connection: close\r\n'
+        header = ('HTTP/1.1 %s\r\n%s\r\n' % (status, headers)).encode()
+        if content:
+            self.request.sendall(header, sendMoreFlag)
+            self.request.sendall(content)
+        else:
+            self.request.sendall(header)
+
     def sendStatus(self):
-        global RB
-        powerCorrection = 100.0 / maxPower
-        leftMotor = RB.GetMotor2() * powerCorrection
-        rightMotor = RB.GetMotor1() * powerCorrection
-        servoPosition = RB.GetServoPosition() * 100.0
-        httpText = '''\
-        <html>
-          <body style="margin:0">
-            <center>
-              <table width="75%%" border="0">
-                <tr>
-                  <td width="33%%" align="left">Servo: %.0f %%</td>
-                  <td width="33%%" align="center">Left: %.0f %%</td>
-                  <td width="33%%" align="right">Right: %.0f %%</td>
-                </tr>
-              </table>
-            </center>
-          </body>
-        </html>
-        ''' % (servoPosition, leftMotor, rightMotor)
-        self.sendText(httpText)
+        self.sendReply('200 OK', 'Content-Type: text/html\r\nCache-Control: no-cache\r\n', statusPage.Get())
 
     def sendText(self, content):
         content = textwrap.dedent(content)
-        httpReply = 'HTTP/1.0 200 OK\n\n%s' % (content)
         if sys.version_info[0] > 2:
-            httpReply = httpReply.encode()
-        self.request.sendall(httpReply)
+            content = content.encode()
+        self.sendReply('200 OK', 'Content-Type: text/html\r\nCache-Control: no-cache\r\n', content)
 
-    def sendImage(self, content):
+    def sendError(self, status, message, headers = ''):
         if sys.version_info[0] > 2:
-            httpReply = 'HTTP/1.0 200 OK\n\n'.encode() + bytes(content)
+            message = message.encode()
+        self.sendReply(status, 'Content-Type: text/plain\r\n' + headers, message)
+
+    def sendImage(self, content, etag):
+        self.sendReply('200 OK', 'Content-Type: image/jpeg\r\nETag: %s\r\nCache-Control: no-cache\r\n' % (etag),
+                       FrameView(content))
+
+    def runWebSocket(self, key):
+        global watchdog
+        # Accept the connection, see RFC 6455
+        accept = base64.b64encode(hashlib.sha1((key + '258EAFA5-E914-47DA-95CA-C5AB0DC85B11').encode()).digest())
+        self.keepAlive = False
+        self.request.sendall(('HTTP/1.1 101 Switching Protocols\r\n'
+                              'Upgrade: websocket\r\n'
+                              'Connection: Upgrade\r\n'
+                              'Sec-WebSocket-Accept: %s\r\n\r\n' % (accept.decode())).encode())
+        try:
+            while running:
+                # Send the status if nothing arrives for a while
+                readable, writable, errored = select.select([self.request], [], [], statusInterval)
+                if not readable:
+                    self.sendWebSocket(0x1, StatusText().encode())
+                    continue
+                opcode, payload = self.readWebSocket()
+                receiptTime = time.time()
+                if opcode == 0x8:
+                    # Close
+                    self.sendWebSocket(0x8, payload[:2])
+                    break
+                elif opcode == 0x9:
+                    # Ping
+                    self.sendWebSocket(0xA, payload)
+                elif opcode == 0x1:
+                    # Drive command: "speed steering"
+                    try:
+                        speed, steering = [float(value) for value in payload.decode().split()]
+                    except ValueError:
+                        speed = 0.0
+                        steering = 0.0
+                    if not (Finite(speed) and Finite(steering)):
+                        # Dropped, the last command carries on until the next one or the watchdog
+                        continue
+                    watchdog.event.set()
+                    actuator.Request(speed, steering, receiptTime)
+                    self.sendWebSocket(0x1, StatusText().encode())
+                    driveLatency.Record(time.time() - receiptTime)
+                    driveTimes.Observe('ack', time.time() - receiptTime)
+        except (socket.error, EOFError):
+            # Browser has gone
+            pass
+
+    def readExactly(self, length):
+        data = bytearray()
+        while len(data) < length:
+            chunk = self.request.recv(length - len(data))
+            if not chunk:
+                raise EOFError('WebSocket closed')
+            data.extend(chunk)
+        return data
+
+    def readWebSocket(self):
+        # Reads one frame, returns the opcode and unmasked payload
+        first, second = self.readExactly(2)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('>H', bytes(self.readExactly(2)))[0]
+        elif length == 127:
+            length = struct.unpack('>Q', bytes(self.readExactly(8)))[0]
+        if length > 1024:
+            raise EOFError('WebSocket message too long')
+        if second & 0x80:
+            mask = self.readExactly(4)
+        else:
+            mask = bytearray(4)
+        payload = self.readExactly(length)
+        for i in range(length):
+            payload[i] ^= mask[i % 4]
+        return opcode, payload
+
+    def sendWebSocket(self, opcode, payload):
+        # Sends one unmasked frame, longer payloads use the 16 or 64 bit length forms
+        payload = bytes(payload)
+        length = len(payload)
+        if length < 126:
+            header = bytes(bytearray([0x80 | opcode, length]))
+        elif length < 0x10000:
+            header = bytes(bytearray([0x80 | opcode, 126])) + struct.pack('>H', length)
         else:
-            httpReply = 'HTTP/1.0 200 OK\n\n%s' % (content.tostring())
-        self.request.sendall(httpReply)
+            header = bytes(bytearray([0x80 | opcode, 127])) + struct.pack('>Q', length)
+        self.request.sendall(header + payload)
 
+    def sendBusy(self):
+        self.sendError('503 Service Unavailable', 'Too many viewers')
 
-# Create the image buffer frame
-lastFrame = None
-lockFrame = threading.Lock()
+    def sendStream(self):
+        global watchdog
+        # Sends each new frame as part of a multipart MJPEG reply, no faster than displayRate
+        lastSequence = 0
+        nextSend = time.time()
+        rate = StreamRate(self.request)
+        # The stream only ends when the connection does
+        self.keepAlive = False
+        try:
+            self.request.sendall(('HTTP/1.1 200 OK\r\n'
+                                  'Content-Type: multipart/x-mixed-replace; boundary=frame\r\n'
+                                  'Cache-Control: no-cache\r\n'
+                                  'Connection: close\r\n\r\n').encode())
+            while running:
+                # Wait for a frame newer than the last one sent
+                delay = nextSend - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                if frameCache.WaitForFrame(rate.variant, lastSequence, 1) <= lastSequence:
+                    continue
+                nextSend = max(nextSend + 1.0 / displayRate, time.time())
+                if not rate.Check():
+                    # Viewer is behind, skip this frame instead of queueing it
+                    lastSequence = frameCache.sequence
+                    continue
+                sendFrame, sequence, captureTime = frameCache.GetJpeg(rate.variant)
+                if (sendFrame is None) or (sequence <= lastSequence):
+                    continue
+                lastSequence = sequence
+                jpeg = FrameView(sendFrame)
+                header = '--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n' % (len(jpeg))
+                self.request.sendall(header.encode(), sendMoreFlag)
+                self.request.sendall(jpeg, sendMoreFlag)
+                self.request.sendall('\r\n'.encode())
+                frameTimes.Observe('send', time.time() - captureTime)
+                rate.Sent(len(header) + len(jpeg) + 2)
+                # A viewer receiving frames counts as an active connection, as the image requests did before
+                watchdog.event.set()
+        except socket.error:
+            # Viewer has gone
+            pass
+
+
+# Each encoder holds on to one frame while it works, the camera needs at least one more to write into
+if frameBuffers <= encoderThreads:
+    print('frameBuffers must be more than encoderThreads, using %d frame buffers' % (encoderThreads + 1))
+    frameBuffers = encoderThreads + 1
+
+# Create the timing histograms, the image buffer frame and the threads which encode it
+# Camera stages, all but the last two are timed separately:
+#   capture     picamera filling a frame buffer, including waiting for the next frame
+#   wait        frame waiting for a free encoder
+#   rotate      turning the frame the right way up
+#   encode      scaling and encoding the frame for every wanted variant
+#   publish     from capture until the frame is available to viewers
+#   send        from capture until the frame has been handed to a viewer's connection
+# Drive stages: write is the I²C transfer, apply and ack are from the request arriving to the motors being set and the reply being sent
+frameTimes = StageHistogram('rbweb_frame_seconds', 'Time taken by each stage of getting a camera frame to a viewer',
+                            ['capture', 'wait', 'rotate', 'encode', 'publish', 'send'])
+driveTimes = StageHistogram('rbweb_drive_seconds', 'Time taken by each stage of handling a drive command',
+                            ['write', 'apply', 'ack'])
+frameCache = FrameCache()
+encoders = [FrameEncoder() for i in range(encoderThreads)]
+photoWriter = PhotoWriter()
+imageSenders = threading.BoundedSemaphore(maxImageSenders)
+burstRunning = threading.Lock()
+driveLatency = LatencyMonitor(driveLatencyBound)
+
+# Pages which never change, built once at startup
+startTime = int(time.time())
+imageRatio = (100.0 * imageHeight) / imageWidth
+mainPage = CachedPage('''\
+    <html>
+      <head>
+        <script language="JavaScript"><!--
+          var socket = null;
+          function Connect() {
+            if (!window.WebSocket) return;
+            socket = new WebSocket("ws://" + location.host + "/ws");
+            socket.onmessage = function(event) {
+              var values = event.data.split(" ");
+              ShowStatus(values[0], values[1], values[2], values[3]);
+            };
+            socket.onclose = function() {
+              socket = null;
+              setTimeout(Connect, 1000);
+            };
+          }
+          function ShowStatus(servo, left, right, saving) {
+            var iframe = document.getElementById("setDrive");
+            iframe.contentDocument.body.innerHTML = '<center><table width="75%%" border="0"><tr>' +
+                '<td width="25%%" align="left">Servo: ' + servo + ' %%</td>' +
+                '<td width="25%%" align="center">Left: ' + left + ' %%</td>' +
+                '<td width="25%%" align="center">Right: ' + right + ' %%</td>' +
+                '<td width="25%%" align="right">Saving: ' + saving + '</td>' +
+                '</tr></table></center>';
+          }
+          function Drive() {
+            motors = speed.value / 100.0;
+            turn = steering.value / 100.0;
+            if (socket && socket.readyState == 1) {
+              socket.send(motors + " " + turn);
+            } else {
+              var iframe = document.getElementById("setDrive");
+              iframe.src = "/set/" + motors + "/" + turn;
+            }
+          }
+          // Resend the drive setting regularly so the watchdog knows we are still here
+          setInterval(function() { if (socket && socket.readyState == 1) Drive(); }, 500);
+          function Steering(level) {
+            steering.value = level;
+            Drive();
+          }
+          function Speed(level) {
+            speed.value = level;
+            Drive();
+          }
+          function Photo() {
+            var iframe = document.getElementById("setDrive");
+            iframe.src = "/photo";
+          }
+          function Burst() {
+            var iframe = document.getElementById("setDrive");
+            iframe.src = "/burst/frames/10";
+          }
+        //--></script>
+        <style>
+          .slidecontainer { width: 100%%; }
+          .slider {
+            -webkit-appearance: none;
+            width: 100%%;
+            height: 80px;
+            border-radius: 25px;
+            background: #D8D8D8;
+            outline: none;
+          }
+          .slider::-webkit-slider-thumb {
+            -webkit-appearance: none;
+            appearance: none;
+            width: 35px;
+            height: 80px;
+            border-radius: 50%%;
+            background: #000000;
+          }
+          .slider::-moz-range-thumb {
+            width: 35px;
+            height: 80px;
+            border-radius: 50%%;
+            background: #000000;
+          }
+        </style>
+      </head>
+      <body style="width:100%%; max-width:%ipx;" onLoad="Connect()">
+        <div style="position:relative; padding-top:%f%%;">
+          <iframe src="/stream" style="position:absolute;top:0;left:0;width:100%%;height:100%%;" frameborder="0"></iframe>
+        </div>
+        <iframe id="setDrive" src="/set/0/0" width="100%%" height="30" frameborder="0"></iframe>
+        <center>
+          <h2>Steering</h2>
+          <table width="100%%" border="0">
+            <tr>
+              <td width="33%%" align="left">left</td>
+              <td width="33%%" align="center">straight</td>
+              <td width="33%%" align="right">right</td>
+            </tr>
+            <tr>
+              <td colspan="3">
+                <input id="steering" type="range" min="-100" max="100" value="0" class="slider" oninput="Drive()" onchange="Drive()"/>
+              </td>
+            </tr>
+          </table>
+          <table width="100%%" border="0">
+            <tr>
+              <td width="20%%"><button onclick="Steering(-100)" style="width:100%%;height:80px;"><b>Hard left</b></button></td>
+              <td width="20%%"><button onclick="Steering(-50)" style="width:100%%;height:80px;"><b>Left</b></button></td>
+              <td width="20%%"><button onclick="Steering(0)" style="width:100%%;height:80px;"><b>Straight</b></button></td>
+              <td width="20%%"><button onclick="Steering(50)" style="width:100%%;height:80px;"><b>Right</b></button></td>
+              <td width="20%%"><button onclick="Steering(100)" style="width:100%%;height:80px;"><b>Hard right</b></button></td>
+            </tr>
+          </table>
+          <h2>Speed</h2>
+          <table width="100%%" border="0">
+            <tr>
+              <td width="33%%" align="left">reverse</td>
+              <td width="33%%" align="center">stopped</td>
+              <td width="33%%" align="right">forward</td>
+            </tr>
+            <tr>
+              <td colspan="3">
+                <input id="speed" type="range" min="-100" max="100" value="0" class="slider" oninput="Drive()" onchange="Drive()"/>
+              </td>
+            </tr>
+          </table>
+          <table width="100%%" border="0">
+            <tr>
+              <td width="20%%"><button onclick="Speed(-100)" style="width:100%%;height:80px;"><b>Reverse</b></button></td>
+              <td width="20%%"><button onclick="Speed(-50)" style="width:100%%;height:80px;"><b>Slow reverse</b></button></td>
+              <td width="20%%"><button onclick="Speed(0)" style="width:100%%;height:80px;"><b>Stop</b></button></td>
+              <td width="20%%"><button onclick="Speed(50)" style="width:100%%;height:80px;"><b>Slow forward</b></button></td>
+              <td width="20%%"><button onclick="Speed(100)" style="width:100%%;height:80px;"><b>Forward</b></button></td>
+            </tr>
+          </table>
+          <h2>Tools</h2>
+          <table width="100%%" border="0">
+            <tr>
+              <td width="30%%"></td>
+              <td width="20%%"><button onclick="Photo()" style="width:100%%;height:80px;"><b>Save Photo</b></button></td>
+              <td width="20%%"><button onclick="Burst()" style="width:100%%;height:80px;"><b>Photo Burst</b></button></td>
+              <td width="30%%"></td>
+            </tr>
+          </table>
+        </center>
+      </body>
+    </html>
+    ''' % (maximumWidth, imageRatio))
+streamRatio = 100.0 * (float(imageHeight ** 2) / float(imageWidth ** 2))
+if mjpegStream:
+    # The browser shows each image as it is sent
+    streamPage = CachedPage('''\
+        <html>
+          <body style="margin:0">
+            <center>
+              <img src="/mjpeg" style="width:%f%%;" name="rpicam" />
+            </center>
+          </body>
+        </html>
+        ''' % (streamRatio))
+else:
+    # Set a delayed refresh
+    displayDelay = int(1000 / displayRate)
+    streamPage = CachedPage('''\
+        <html>
+          <head>
+            <script language="JavaScript"><!--
+              var lastImage = null;
+              function refreshImage() {
+                if (!document.images) return;
+                if (!window.fetch) {
+                  document.images["rpicam"].src = "cam.jpg?" + Math.random();
+                  setTimeout("refreshImage()", %d);
+                  return;
+                }
+                // Ask again for the same address, the server answers "not modified" until there is a new frame
+                fetch("/cam.jpg", {cache: "no-cache"}).then(function(response) {
+                  if (response.headers.get("ETag") == lastImage) return null;
+                  lastImage = response.headers.get("ETag");
+                  return response.blob();
+                }).then(function(image) {
+                  if (image) {
+                    URL.revokeObjectURL(document.images["rpicam"].src);
+                    document.images["rpicam"].src = URL.createObjectURL(image);
+                  }
+                }).catch(function() {}).then(function() {
+                  setTimeout("refreshImage()", %d);
+                });
+              }
+            //--></script>
+          </head>
+          <body style="margin:0" onLoad="setTimeout(\'refreshImage()\', %d)">
+            <center>
+              <img src="/cam.jpg" style="width:%f%%;" name="rpicam" />
+            </center>
+          </body>
+        </html>
+        ''' % (displayDelay, displayDelay, displayDelay, streamRatio))
+statusPage = StatusPage()
 
 # Startup sequence
 print('Setup camera')
@@ -463,20 +1737,28 @@ camera = picamera.PiCamera()
 camera.resolution = (imageWidth, imageHeight)
 camera.framerate = frameRate
 
-print('Setup the stream processing thread')
-processor = StreamProcessor()
-
 print('Wait ...')
 time.sleep(2)
 captureThread = ImageCapture()
 
+print('Setup the drive thread')
+actuator = DriveActuator()
+
 print('Setup the watchdog')
 watchdog = Watchdog()
 
+if dashcamDirectory:
+    print('Setup the dashcam recording to %s' % (dashcamDirectory))
+    dashcamWriter = DashcamWriter()
+    dashcamRecorder = DashcamRecorder()
+else:
+    dashcamWriter = None
+    dashcamRecorder = None
+
 # Run the web server until we are told to close
 try:
     httpServer = None
-    httpServer = socketserver.TCPServer(("0.0.0.0", webPort), WebServer)
+    httpServer = ThreadedServer(("0.0.0.0", webPort), WebServer)
 except:
     # Failed to open the port, report common issues
     print('')
@@ -495,7 +1777,10 @@ except KeyboardInterrupt:
     # CTRL+C exit
     print('\nUser shutdown')
 finally:
-    # Turn the motors off under all scenarios
+    # Stop sending drive updates, then turn the motors off under all scenarios
+    actuator.terminated = True
+    actuator.event.set()
+    actuator.join()
     RB.MotorsOff()
     print('Motors off')
 # Tell each thread to stop, and wait for them to end
@@ -503,11 +1788,31 @@ if httpServer is not None:
     httpServer.server_close()
 running = False
 captureThread.join()
-processor.terminated = True
+if dashcamRecorder is not None:
+    dashcamRecorder.join()
+for encoder in encoders:
+    encoder.terminated = True
 watchdog.terminated = True
-processor.join()
+for encoder in encoders:
+    encoder.join()
 watchdog.join()
+print('Saving %d waiting photos...' % (photoWriter.Depth()))
+photoWriter.terminated = True
+photoWriter.join()
+if dashcamWriter is not None:
+    dashcamWriter.terminated = True
+    dashcamWriter.join()
 del camera
+RB.StopSharedState()
+RB.StopTelemetry()
+RB.StopLedPattern()
 RB.SetLed(False)
 RB.MotorsOff()
+RB.FlushPrints(True)
+print(actuator.Report())
+print(driveLatency.Report())
+print(frameCache.Report())
+print(photoWriter.Report())
+if dashcamWriter is not None:
+    print(dashcamWriter.Report())
 print('Web-server terminated.')